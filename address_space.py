@@ -0,0 +1,149 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class AddressSpace:
+    '''
+
+    '''
+    def __init__(self, upper_limit):
+        self._upper_limit = upper_limit
+        # One byte per address: non-zero if in use.
+        self.address_space = bytearray(self._upper_limit)
+
+    def _validate(self, start, width):
+        if not 1 <= start <= self._upper_limit:
+            logger.error('Address outside of acceptable limits')
+            return False
+
+        if not 1 <= width <= self._upper_limit:
+            logger.error('Device width outside of acceptable limits')
+            return False
+
+        if start + width - 1 > self._upper_limit:
+            logger.error('Device too wide to fit at this address')
+            return False
+
+        return True
+
+    def occupy(self, addresses):
+        '''Replace the contents of the address space with the given (1-indexed) addresses.'''
+        addresses = set(addresses)
+        self.address_space = bytearray(idx + 1 in addresses for idx in range(self._upper_limit))
+
+    def fill(self, start, width):
+        '''Fill a block in the address space'''
+        if not self._validate(start, width):
+            return False
+
+        start -= 1
+        # Check the whole block before changing any of it.
+        if any(self.address_space[start:start + width]):
+            logger.error('A device is already assigned at this address')
+            return False
+
+        self.address_space[start:start + width] = b'\x01' * width
+        return True
+
+    def empty(self, start, width):
+        '''Empty a block in the address space'''
+        if not self._validate(start, width):
+            return False
+
+        start -= 1
+        if not all(self.address_space[start:start + width]):
+            logger.error('There is no device currently assigned at this address')
+            return False
+
+        self.address_space[start:start + width] = bytes(width)
+        return True
+
+    def locate(self, start, width, previous=None):
+        '''locate an appropriately sized empty block in the address space.
+
+        The first block found at or after `start` is returned; failing that,
+        the first found from the beginning of the space.
+
+        Set `previous` if this is to replace an already existing block.
+        '''
+        if not self._validate(start, width):
+            return -1
+
+        occupancy = self.address_space
+        if previous is not None:
+            if not self._validate(previous[0], previous[1]):
+                return -1
+            prev_start = previous[0] - 1
+            if not all(occupancy[prev_start:prev_start + previous[1]]):
+                logger.error('There is no device currently assigned at the previous address')
+                return -1
+            occupancy = bytearray(occupancy)
+            occupancy[prev_start:prev_start + previous[1]] = bytes(previous[1])
+
+        # A search for a run of `width` free (zero) addresses.
+        found = occupancy.find(bytes(width), start - 1)
+        if found == -1 and start != 1:
+            found = occupancy.find(bytes(width))
+        return found + 1 if found != -1 else -1
+
+class MidiChannelAddressSpace(AddressSpace):
+    '''
+    MIDI Channels 1-16 (NOT 0-15)
+    '''
+    def __init__(self):
+        super().__init__(16)
+
+    def add(self, address, width):
+        '''Add a fixture into the address space.'''
+        return self.fill(address, width)
+
+    def remove(self, address, width):
+        '''Removes a fixture from the address space.'''
+        return self.empty(address, width)
+
+    def find(self, address, width, previous=None):
+        '''Find space wide enough for a fixture.'''
+        return self.locate(address, width, previous)
+
+class MidiDeviceIdAddressSpace(AddressSpace):
+    '''
+    MIDI Device ID 0-111
+    '''
+    def __init__(self):
+        super().__init__(111)
+
+    def add(self, address):
+        '''Add a fixture into the address space.'''
+        return self.fill(address, 1)
+
+    def remove(self, address):
+        '''Removes a fixture from the address space.'''
+        return self.empty(address, 1)
+
+    def find(self, address, previous=None):
+        '''Find an empty slot for a fixture.'''
+        if previous is not None:
+            return self.locate(address, 1, previous=[previous, 1])
+        return self.locate(address, 1)
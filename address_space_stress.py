@@ -0,0 +1,214 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Randomised stress test and benchmark of the patch address spaces.
+
+Drives `MidiChannelAddressSpace`, `MidiDeviceIdAddressSpace` and (to guard
+how allocation scales) larger generic `AddressSpace`s through long random
+sequences of add, remove and find operations. Every result is checked
+against a simple reference model, and the worst-case time of each kind of
+operation is reported:
+
+    python address_space_stress.py --operations 100000 --seed 1
+    python address_space_stress.py --max-us 200    # Fail if anything is slower
+
+Deliberately standalone (run it from this directory); it needs neither Qt nor LiSP.
+'''
+
+import argparse
+import gc
+import logging
+import random
+import sys
+from time import perf_counter
+
+from address_space import AddressSpace, MidiChannelAddressSpace, MidiDeviceIdAddressSpace
+
+class ReferenceSpace:
+    '''The obvious (and slow) implementation of an address space, to check against.'''
+
+    def __init__(self, upper_limit):
+        self.upper_limit = upper_limit
+        self.occupied = set()
+
+    def _valid(self, start, width):
+        return 1 <= start <= self.upper_limit and 1 <= width <= self.upper_limit \
+            and start + width - 1 <= self.upper_limit
+
+    def fill(self, start, width):
+        block = set(range(start, start + width))
+        if not self._valid(start, width) or block & self.occupied:
+            return False
+        self.occupied |= block
+        return True
+
+    def empty(self, start, width):
+        block = set(range(start, start + width))
+        if not self._valid(start, width) or not block <= self.occupied:
+            return False
+        self.occupied -= block
+        return True
+
+    def locate(self, start, width, previous=None):
+        if not self._valid(start, width):
+            return -1
+        occupied = self.occupied
+        if previous is not None:
+            block = set(range(previous[0], previous[0] + previous[1]))
+            if not self._valid(*previous) or not block <= occupied:
+                return -1
+            occupied = occupied - block
+
+        candidates = list(range(start, self.upper_limit - width + 2))
+        if start != 1:
+            candidates += list(range(1, self.upper_limit - width + 2))
+        for candidate in candidates:
+            if not occupied.intersection(range(candidate, candidate + width)):
+                return candidate
+        return -1
+
+class Timings:
+    def __init__(self):
+        self.counts = {}
+        self.totals = {}
+        self.worst = {}
+
+    def record(self, operation, elapsed):
+        self.counts[operation] = self.counts.get(operation, 0) + 1
+        self.totals[operation] = self.totals.get(operation, 0) + elapsed
+        self.worst[operation] = max(self.worst.get(operation, 0), elapsed)
+
+    def worst_us(self):
+        return max(self.worst.values(), default=0) * 1e6
+
+    def report(self, name):
+        for operation in sorted(self.counts):
+            print('{0:<28} {1:<7} {2:>8} ops  mean {3:>8.2f} us  worst {4:>8.2f} us'.format(
+                name, operation, self.counts[operation],
+                self.totals[operation] / self.counts[operation] * 1e6,
+                self.worst[operation] * 1e6))
+
+def _timed(timings, operation, function, *args):
+    started = perf_counter()
+    result = function(*args)
+    timings.record(operation, perf_counter() - started)
+    return result
+
+def stress(name, space, upper_limit, max_width, operations, rng):
+    '''Runs random operations against `space` and a reference. Returns the timings and any mismatches.'''
+    reference = ReferenceSpace(upper_limit)
+    blocks = []
+    timings = Timings()
+    mismatches = []
+
+    def check(operation, args, actual, expected):
+        if actual != expected:
+            mismatches.append('{0}: {1}{2} returned {3}, expected {4}'.format(
+                name, operation, args, actual, expected))
+
+    for _ in range(operations):
+        choice = rng.random()
+        width = rng.randint(1, max_width)
+        # Occasionally out of range, to check that's refused consistently.
+        start = rng.randint(0, upper_limit + 1)
+
+        if choice < 0.4:
+            found = _timed(timings, 'find', space.locate, start, width)
+            check('locate', (start, width), found, reference.locate(start, width))
+            if found != -1:
+                _timed(timings, 'add', space.fill, found, width)
+                reference.fill(found, width)
+                blocks.append((found, width))
+
+        elif choice < 0.55:
+            args = (start, width)
+            expected = reference.fill(*args)
+            check('fill', args, _timed(timings, 'add', space.fill, *args), expected)
+            if expected:
+                blocks.append(args)
+
+        elif choice < 0.85 and blocks:
+            args = blocks.pop(rng.randrange(len(blocks)))
+            check('empty', args, _timed(timings, 'remove', space.empty, *args),
+                  reference.empty(*args))
+
+        elif blocks:
+            previous = list(rng.choice(blocks))
+            args = (start, width, previous)
+            check('locate', args, _timed(timings, 'move', space.locate, *args),
+                  reference.locate(*args))
+
+        occupied = {idx + 1 for idx, used in enumerate(space.address_space) if used}
+        if occupied != reference.occupied:
+            mismatches.append('{0}: contents differ from reference'.format(name))
+        if mismatches:
+            break
+
+    return timings, mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('--operations', type=int, default=20000,
+                        help='Operations per address space')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1024, 4096],
+                        help='Sizes of the larger, generic address spaces to also test')
+    parser.add_argument('--max-us', type=float, default=None,
+                        help='Fail if any single operation takes longer than this (microseconds)')
+    options = parser.parse_args(argv)
+
+    # Refused operations are logged as errors; they're expected here.
+    logging.disable(logging.CRITICAL)
+
+    seed = options.seed if options.seed is not None else random.randrange(2 ** 32)
+    print('Seed: {0}'.format(seed))
+    rng = random.Random(seed)
+
+    cases = [
+        ('MidiChannelAddressSpace', MidiChannelAddressSpace(), 16, 4),
+        ('MidiDeviceIdAddressSpace', MidiDeviceIdAddressSpace(), 111, 1),
+    ]
+    cases += [('AddressSpace({0})'.format(size), AddressSpace(size), size, 8)
+              for size in options.sizes]
+
+    failed = False
+    for name, space, upper_limit, max_width in cases:
+        # Keep garbage collection pauses out of the timings.
+        gc.collect()
+        gc.disable()
+        try:
+            timings, mismatches = stress(name, space, upper_limit, max_width,
+                                         options.operations, rng)
+        finally:
+            gc.enable()
+        timings.report(name)
+        for mismatch in mismatches:
+            failed = True
+            print('MISMATCH ' + mismatch)
+        if options.max_us is not None and timings.worst_us() > options.max_us:
+            failed = True
+            print('TOO SLOW {0}: worst case {1:.2f} us'.format(name, timings.worst_us()))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
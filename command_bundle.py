@@ -0,0 +1,156 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+from hashlib import sha1
+from importlib.util import find_spec
+import json
+import logging
+import os
+
+from mido import Message
+
+from .command_messages import CommandMessages
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = '.fixtures.json'
+
+def bundle_path(session_file):
+    '''Returns the path of the compiled-command bundle belonging to a session file.'''
+    return os.path.splitext(session_file)[0] + BUNDLE_SUFFIX
+
+def library_locations():
+    '''Returns the directories the fixture library is installed in, without importing it.'''
+    spec = find_spec('midi_fixture_library')
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    return list(spec.submodule_search_locations)
+
+def library_files(location):
+    '''Yields `(root, filename)` for every file of the fixture library within a location, in order.'''
+    for root, dirs, files in os.walk(location):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for filename in sorted(files):
+            yield root, filename
+
+def library_fingerprint():
+    '''Fingerprints the installed fixture library, without importing or parsing it.
+
+    The fingerprint covers the name, size and modification time of every file
+    within the library's package directory, so any change to the library code
+    or to a fixture definition changes it.
+    '''
+    locations = library_locations()
+    if not locations:
+        return None
+
+    digest = sha1()
+    for location in locations:
+        for root, filename in library_files(location):
+            stat = os.stat(os.path.join(root, filename))
+            digest.update('{0}/{1}:{2}:{3}\n'.format(
+                os.path.relpath(root, location), filename, stat.st_size, stat.st_mtime_ns
+            ).encode())
+    return digest.hexdigest()
+
+def patch_fingerprint(patches):
+    '''Fingerprints a session's patch list.'''
+    return sha1(json.dumps(patches, sort_keys=True).encode()).hexdigest()
+
+class CommandBundle:
+    '''Pre-built MIDI messages for every Fixture Command cue of a session.
+
+    Saved alongside the session file as (human-readable) JSON, it lets cues be
+    sent without loading the fixture library, and doubles as an audit of
+    exactly what each cue will send.
+
+    Each cue's entry also records the command it was built from, so a cue
+    edited since the bundle was compiled is not served stale messages.
+    '''
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self._cues = {}
+        self._parsed = {}
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a bundle from file. Returns `None` if it can't be read.'''
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                content = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if content.get('version') != BUNDLE_VERSION:
+            logger.debug('Ignoring fixture command bundle of unsupported version.')
+            return None
+
+        bundle = cls(content.get('fingerprint'))
+        bundle._cues = content.get('cues', {}) # pylint: disable=protected-access
+        return bundle
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'version': BUNDLE_VERSION,
+                'fingerprint': self.fingerprint,
+                'cues': self._cues,
+            }, file, indent=2, sort_keys=True)
+
+    def add(self, cue_id, command, messages):
+        '''Adds a cue's built messages (as returned by `build_commands`) to the bundle.'''
+        self._cues[cue_id] = {
+            'command': command,
+            'messages': {
+                midi_patch_id: [message.hex() for message in output_messages]
+                for midi_patch_id, output_messages in messages.items()
+            },
+        }
+        self._parsed.pop(cue_id, None)
+
+    def messages(self, cue_id, command):
+        '''Returns a cue's pre-built messages, or `None` if the bundle can't serve it.'''
+        entry = self._cues.get(cue_id)
+        if entry is None or entry['command'] != command:
+            return None
+
+        if cue_id not in self._parsed:
+            messages = CommandMessages()
+            for midi_patch_id, output_messages in entry['messages'].items():
+                messages.extend(midi_patch_id,
+                                command['patch_id'],
+                                [Message.from_hex(message) for message in output_messages])
+            messages.commands.append((command['patch_id'], command['command'], command['args']))
+            self._parsed[cue_id] = messages
+        return self._parsed[cue_id]
+
+    def discard(self, patch_ids):
+        '''Drops the entries of cues that command any of the given fixture patches.'''
+        for cue_id in [cue_id for cue_id, entry in self._cues.items()
+                       if entry['command']['patch_id'] in patch_ids]:
+            del self._cues[cue_id]
+            self._parsed.pop(cue_id, None)
+
+    def __len__(self):
+        return len(self._cues)
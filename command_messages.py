@@ -0,0 +1,41 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+class CommandMessages(dict):
+    '''Built MIDI messages, as lists keyed by MIDI output patch id.
+
+    Also records (in `sources`) which fixture patch each consecutive run of
+    messages to an output was built for, so that what is sent can be
+    accounted for per fixture; and (in `commands`) the `(patch_id, command,
+    args)` entries the messages were built from.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.sources = {}
+        self.commands = []
+
+    def extend(self, midi_patch_id, patch_id, messages):
+        '''Append messages, built for the fixture at `patch_id`, to those for an output.'''
+        self.setdefault(midi_patch_id, []).extend(messages)
+        if messages:
+            self.sources.setdefault(midi_patch_id, []).append((patch_id, len(messages)))
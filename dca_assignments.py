@@ -0,0 +1,83 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+class DcaAssignmentMatrix:
+    '''Tracks which DCAs each channel of the session's DCA device is assigned to.
+
+    The matrix only records what has been sent to the device. A channel that
+    has not been sent anything since the matrix was last reset is "unknown".
+    '''
+
+    ASSIGN = 'assign'
+    UNASSIGN = 'unassign'
+
+    def __init__(self):
+        self._matrix = {}
+
+    def reset(self):
+        '''Forget everything, e.g. because the DCA device has been changed.'''
+        self._matrix = {}
+
+    def membership(self, channel):
+        '''Returns the set of DCAs a channel is known to be assigned to, or None if unknown.'''
+        return self._matrix.get(channel)
+
+    def diff(self, assignments, dca_count=None):
+        '''Works out the changes needed to reach the given assignments.
+
+        `assignments` is a dict of channel → iterable of DCAs. Channels not
+        present are left untouched.
+
+        For channels of unknown state, every wanted DCA is assigned. If
+        `dca_count` is given, the channel is also unassigned from every other
+        DCA in `range(dca_count)`.
+
+        Returns an ordered list of `(action, channel, dca)` tuples: all
+        unassignments first (so a channel is never briefly in both its old
+        and new DCAs), then all assignments; each ordered by channel then DCA.
+        '''
+        unassign = []
+        assign = []
+        for channel in sorted(assignments):
+            wanted = set(assignments[channel])
+            current = self._matrix.get(channel)
+
+            if current is None:
+                if dca_count is not None:
+                    unassign.extend((channel, dca) for dca in range(dca_count) if dca not in wanted)
+                assign.extend((channel, dca) for dca in sorted(wanted))
+                continue
+
+            unassign.extend((channel, dca) for dca in sorted(current - wanted))
+            assign.extend((channel, dca) for dca in sorted(wanted - current))
+
+        return [(self.UNASSIGN, channel, dca) for channel, dca in unassign] + \
+            [(self.ASSIGN, channel, dca) for channel, dca in assign]
+
+    def apply(self, changes):
+        '''Record changes (as returned by `diff`) as having been sent.'''
+        for action, channel, dca in changes:
+            membership = self._matrix.setdefault(channel, set())
+            if action == self.ASSIGN:
+                membership.add(dca)
+            else:
+                membership.discard(dca)
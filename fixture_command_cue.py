@@ -22,6 +22,7 @@
 
 # pylint: disable=missing-docstring
 
+from copy import deepcopy
 import logging
 
 # pylint: disable=no-name-in-module
@@ -32,41 +33,74 @@ from PyQt5.QtWidgets import QFormLayout, QFrame, QComboBox, QSpinBox, QLineEdit
 from lisp.core.has_properties import Property
 from lisp.cues.cue import Cue
 from lisp.plugins import get_plugin
-from lisp.plugins.midi.midi_utils import midi_from_dict
 from lisp.ui.settings.cue_settings import CueSettingsRegistry
 from lisp.ui.settings.pages import SettingsPage
 from lisp.ui.ui_utils import translate
 
-from .ui import Fader, PatchSelector
+from .profiling import profiled
+from .send_scheduler import now
+from .ui import CommandPicker, Fader, PatchSelector, command_index
 
 class FixtureCommandCue(Cue):
     Name = QT_TRANSLATE_NOOP('CueName', 'Fixture Command Cue')
 
     fixture_command = Property()
+    send_delay = Property(default=0)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.name = translate('CueName', self.Name)
-        self._midi = get_plugin('Midi')
         self._plugin = get_plugin('MidiFixtureControl')
+        self._armed = None
 
+    def arm(self):
+        '''Build this cue's messages in advance, so starting it only has to send them.
+
+        Called by the plugin when this cue becomes the standby cue. The armed
+        messages are discarded if the cue or the session's patch changes.
+        '''
+        self._armed = None
+        if not self.fixture_command or not self.fixture_command['patch_id']:
+            return
+        self._armed = (self._plugin.patch_generation, deepcopy(self.fixture_command), self._build())
+
+    def _build(self):
+        messages = self._plugin.compiled_messages(self)
+        if messages is None:
+            messages = self._plugin.build_commands([(self.fixture_command['patch_id'],
+                                                     self.fixture_command['command'],
+                                                     self.fixture_command['args'])])
+        return messages
+
+    def _armed_messages(self):
+        if self._armed is None:
+            return None
+        generation, command, messages = self._armed
+        if generation != self._plugin.patch_generation or command != self.fixture_command:
+            self._armed = None
+            return None
+        return messages
+
+    @profiled('cue_start')
     def __start__(self, _):
+        # Delays are measured from here, so they're unaffected by how long
+        # the command takes to build.
+        timestamp = now() + self.send_delay / 1000 if self.send_delay else None
+
         if not self.fixture_command or not self.fixture_command['patch_id']:
             return False
 
-        midi_patch_id = self._plugin.get_patched_output(self.fixture_command['patch_id'])
-        profile = self._plugin.get_profile(self.fixture_command['patch_id'])
-        midi_messages = profile.build_command(self.fixture_command['command'],
-                                              self.fixture_command['args'])
-
-        for dict_message in midi_messages:
-            self._midi.send(midi_patch_id, midi_from_dict(dict_message))
+        messages = self._armed_messages()
+        if messages is None:
+            messages = self._build()
+        self._plugin.dispatch(messages, timestamp)
 
         return False
 
 class FixtureCommandCueSettings(SettingsPage):
     Name = QT_TRANSLATE_NOOP('SettingsPageName', 'Fixture Command Settings')
 
+    @profiled('cue_settings_page')
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.setLayout(QFormLayout())
@@ -74,14 +108,20 @@ class FixtureCommandCueSettings(SettingsPage):
 
         # Dropdown of available fixture patches
         self.patch_combo = PatchSelector(self)
-        self.patch_combo.refresh()
         self.patch_combo.currentIndexChanged.connect(self._select_patch)
         self.layout().addRow('Patched Fixture:', self.patch_combo)
 
-        # Dropdown for command type
-        self.command_combo = QComboBox(self)
+        # Dropdown (and search) for command type
+        self.command_combo = CommandPicker(self)
         self.layout().addRow('Command:', self.command_combo)
 
+        # Delay between the cue starting and the command being sent
+        self.delay_spin = QSpinBox(self)
+        self.delay_spin.setRange(0, 60000)
+        self.delay_spin.setSingleStep(10)
+        self.delay_spin.setSuffix(' ms')
+        self.layout().addRow('Send Delay:', self.delay_spin)
+
         # Horizontal line
         line = QFrame(self)
         line.setFrameShape(QFrame.HLine)
@@ -89,19 +129,9 @@ class FixtureCommandCueSettings(SettingsPage):
         self.layout().addRow(line)
 
     def _select_patch(self, _):
-        # Disconnect and clear command combo
+        # Disconnect command combo
         if self.command_combo.receivers(self.command_combo.currentIndexChanged) > 0:
             self.command_combo.currentIndexChanged.disconnect()
-        self.command_combo.clear()
-
-        # Get profile
-        fixture_profile = self._get_current_fixture_profile()
-
-        # Supply new command list
-        for cmd in fixture_profile.command_list:
-            details = fixture_profile.command(cmd)
-            self.command_combo.addItem(details['caption'] if 'caption' in details else cmd, cmd)
-        self.command_combo.currentIndexChanged.connect(self._select_command)
 
         # Hide all current sources
         for widget in self.argument_sources.values():
@@ -110,6 +140,21 @@ class FixtureCommandCueSettings(SettingsPage):
                 row.labelItem.widget().hide()
                 widget.hide()
 
+        # Get profile
+        fixture_profile = self._get_current_fixture_profile()
+
+        # Supply new command list (indexed once per fixture definition, then shared)
+        plugin = get_plugin('MidiFixtureControl')
+        patch_id = self.patch_combo.currentData() or plugin.SessionConfig['default_patch']
+        patch = plugin.registry.patches.get(patch_id)
+        if fixture_profile is None or patch is None:
+            # Nothing to command: don't leave the previous fixture's commands on offer.
+            self.command_combo.setCommandIndex(None)
+            return
+        fixture_id = patch['fixture_id']
+        self.command_combo.setCommandIndex(command_index(fixture_id, fixture_profile))
+        self.command_combo.currentIndexChanged.connect(self._select_command)
+
         # Supply arg sources
         for name, definition in fixture_profile.parameters().items():
             if name in self.argument_sources:
@@ -182,10 +227,13 @@ class FixtureCommandCueSettings(SettingsPage):
                 continue
 
             widget = self.argument_sources[name]
-            if isinstance(widget, QSpinBox) or isinstance(widget, Fader):
+            if isinstance(widget, QSpinBox):
                 limit = (limit for limit in values)
                 widget.setRange(next(limit), next(limit))
 
+            elif isinstance(widget, Fader):
+                self._set_fader_range(widget, values)
+
             elif isinstance(widget, QComboBox):
                 for option in values:
                     widget.addItem(values[option], option)
@@ -226,11 +274,12 @@ class FixtureCommandCueSettings(SettingsPage):
         for name in parameter_list.keys():
             conf["args"][name] = self._get_value_from_argument_widget(name)
 
-        return {'fixture_command': conf}
+        return {'fixture_command': conf, 'send_delay': self.delay_spin.value()}
 
     # pylint: disable=invalid-name
     def loadSettings(self, settings):
         conf = settings.get('fixture_command', {})
+        self.delay_spin.setValue(settings.get('send_delay', 0))
 
         if conf and conf['patch_id']:
             patch_id = conf['patch_id']
@@ -252,9 +301,12 @@ class FixtureCommandCueSettings(SettingsPage):
         for name, value in conf['args'].items():
             if name in self.argument_sources:
                 widget = self.argument_sources[name]
-                if isinstance(widget, QSpinBox) or isinstance(widget, Fader):
+                if isinstance(widget, QSpinBox):
                     widget.setValue(value)
 
+                elif isinstance(widget, Fader):
+                    widget.setDbValue(value)
+
                 elif isinstance(widget, QComboBox):
                     idx = widget.findData(value)
                     widget.setCurrentIndex(idx if idx > -1 else 0)
@@ -264,8 +316,10 @@ class FixtureCommandCueSettings(SettingsPage):
 
     def _get_value_from_argument_widget(self, widget_name):
         widget = self.argument_sources[widget_name]
-        if isinstance(widget, QSpinBox) or isinstance(widget, Fader):
+        if isinstance(widget, QSpinBox):
             return widget.value()
+        if isinstance(widget, Fader):
+            return widget.dbValue()
         if isinstance(widget, QComboBox):
             return widget.currentData()
         if isinstance(widget, QLineEdit):
@@ -284,9 +338,12 @@ class FixtureCommandCueSettings(SettingsPage):
                     and definition['valuesConditionalOn'] == transmitter_name):
                 widget = self.argument_sources[name]
 
-                if isinstance(widget, QSpinBox) or isinstance(widget, Fader):
+                if isinstance(widget, QSpinBox):
                     limit = (limit for limit in values[current_value])
-                    self.argument_sources[name].setRange(next(limit), next(limit))
+                    widget.setRange(next(limit), next(limit))
+
+                elif isinstance(widget, Fader):
+                    self._set_fader_range(widget, values[current_value])
 
                 elif isinstance(widget, QComboBox):
                     for option in values[current_value]:
@@ -294,6 +351,15 @@ class FixtureCommandCueSettings(SettingsPage):
 
                 # @todo: handle other potential cases
 
+    @staticmethod
+    def _set_fader_range(widget, values):
+        limit = (limit for limit in values)
+        db_min, db_max = next(limit), next(limit)
+        # A range with fractional ends is one the fixture takes fractional dB
+        # values in, so is worth setting in tenths of a dB.
+        widget.setFineResolution(any(value != int(value) for value in (db_min, db_max)))
+        widget.setDbRange(db_min, db_max)
+
     def _get_current_fixture_profile(self):
         return get_plugin('MidiFixtureControl').get_profile(self.patch_combo.currentData())
 
@@ -0,0 +1,204 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+from threading import Lock
+
+from midi_fixture_library import Catalogue, Fixture
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Shared by everything loading from the fixture library, so that only so
+# many definitions are parsed at once.
+_loader_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                  thread_name_prefix='FixtureLoader')
+
+_catalogues = {}
+_catalogues_lock = Lock()
+
+def preload_catalogue(include_unstable=False):
+    '''Starts loading a fixture library Catalogue on the loader pool, if not already loaded.
+
+    Returns a future of the Catalogue.
+    '''
+    with _catalogues_lock:
+        if include_unstable not in _catalogues:
+            _catalogues[include_unstable] = _loader_pool.submit(
+                Catalogue, include_unstable=include_unstable)
+        return _catalogues[include_unstable]
+
+def forget_catalogues():
+    '''Drop the shared Catalogues, so they're loaded afresh when next needed.'''
+    with _catalogues_lock:
+        _catalogues.clear()
+
+def shared_catalogue(include_unstable=False):
+    '''Returns the process-wide fixture library Catalogue, waiting for it to load if necessary.'''
+    return preload_catalogue(include_unstable).result()
+
+class FixtureRegistry:
+    '''A snapshot of the session's patch, and the prepped Fixtures it addresses.
+
+    A registry is never altered once published: when the patch changes, a
+    new registry is derived (see `derive`) and swapped in place of the old
+    one with a single assignment. Anything that reads the registry once (e.g.
+    at the start of a GO) is thus guaranteed a consistent view of it, even
+    if the patch is changed on another thread part-way through.
+
+    The one exception is that Fixtures are prepped on first use, so that
+    profiles of fixtures that are never used need not be loaded. Each is
+    prepped with the address from this registry's own patch, so this doesn't
+    affect consistency.
+
+    Fixtures may also be prepped in advance, in parallel, on a pool of
+    loader threads (see `prep_all`). Until it's ready, each such Fixture is
+    held as a future; asking for it waits for that one Fixture only.
+
+    A Fixture that fails to prep is logged once, and is thereafter treated as
+    absent from this registry (a registry derived or reloaded from it tries
+    again).
+    '''
+
+    def __init__(self, patches=(), generation=0, fixtures=None):
+        self.generation = generation
+        self.patches = {patch['patch_id']: patch for patch in patches}
+        self.outputs = {patch['patch_id']: patch['midi_patch_id'] for patch in patches}
+        self._fixtures = dict(fixtures) if fixtures else {}
+        self._pending = {}
+        self._failed = set()
+        self._lock = Lock()
+
+    @staticmethod
+    def _address(patch):
+        return (
+            patch['fixture_id'],
+            patch['midi_channel'] if 'midi_channel' in patch else None,
+            patch['midi_deviceid'] if 'midi_deviceid' in patch else None,
+        )
+
+    def derive(self, patches):
+        '''Returns a new registry for the given patch, reusing what can be from this one.
+
+        Fixtures whose address is unchanged are shared with this registry.
+        Re-addressed fixtures are not: the new registry preps them afresh with
+        their new address (as it would a newly added patch), so that no Fixture
+        is ever modified once published.
+        '''
+        fixtures = {}
+        for patch in patches:
+            patch_id = patch['patch_id']
+            fixture = self._fixtures.get(patch_id)
+            if fixture is None and patch_id in self._pending and self._pending[patch_id].done() \
+                    and self._pending[patch_id].exception() is None:
+                fixture = self._pending[patch_id].result()
+            if fixture is None or patch_id not in self.patches:
+                continue
+
+            if self._address(patch) == self._address(self.patches[patch_id]):
+                fixtures[patch_id] = fixture
+
+        return FixtureRegistry(patches, self.generation + 1, fixtures)
+
+    def reload(self, fixture_ids):
+        '''Returns a new registry, in which Fixtures of the given definitions are prepped afresh.
+
+        (Only) Fixtures of other definitions are shared with this registry.
+        '''
+        fixtures = {patch_id: fixture for patch_id, fixture in self._fixtures.items()
+                    if self.patches[patch_id]['fixture_id'] not in fixture_ids}
+        return FixtureRegistry(self.patches.values(), self.generation + 1, fixtures)
+
+    @property
+    def fixtures(self):
+        '''The Fixtures prepped so far, keyed by patch id. Do not modify.'''
+        return self._fixtures
+
+    def _prep(self, patch_id):
+        fixture_id, channel, deviceid = self._address(self.patches[patch_id])
+        return Fixture(fixture_id, channel=channel, deviceid=deviceid)
+
+    def _collect(self, patch_id, pending):
+        # Moves a finished future's Fixture into place. Called with the lock held.
+        if self._pending.get(patch_id) is not pending:
+            return self._fixtures.get(patch_id)
+        del self._pending[patch_id]
+
+        error = pending.exception()
+        if error is not None:
+            self._failed.add(patch_id)
+            logger.error('Unable to prep the fixture of patch "%s"', patch_id, exc_info=error)
+            return None
+        self._fixtures[patch_id] = pending.result()
+        return self._fixtures[patch_id]
+
+    def fixture(self, patch_id):
+        '''Returns the prepped Fixture of a patch, prepping it first if necessary.
+
+        Returns `None` if there's no such patch, or its Fixture failed to prep.
+        '''
+        fixture = self._fixtures.get(patch_id)
+        if fixture is not None or patch_id not in self.patches or patch_id in self._failed:
+            return fixture
+
+        with self._lock:
+            if patch_id in self._fixtures:
+                return self._fixtures[patch_id]
+            pending = self._pending.get(patch_id)
+            if pending is None:
+                self._fixtures[patch_id] = self._prep(patch_id)
+                return self._fixtures[patch_id]
+
+        # Being prepped on the loader pool: wait for it (outside the lock, so
+        # others may be fetched meanwhile).
+        pending.exception()
+        with self._lock:
+            return self._collect(patch_id, pending)
+
+    def prep_all(self):
+        '''Start prepping the Fixtures of every patch, in parallel. Does not wait for them.'''
+        with self._lock:
+            for patch_id in self.patches:
+                if patch_id not in self._fixtures and patch_id not in self._pending \
+                        and patch_id not in self._failed:
+                    self._pending[patch_id] = _loader_pool.submit(self._prep, patch_id)
+
+    def ready(self):
+        '''Returns the Fixtures prepped so far (keyed by patch id), without waiting for any.'''
+        with self._lock:
+            for patch_id, pending in list(self._pending.items()):
+                if pending.done():
+                    self._collect(patch_id, pending)
+            return dict(self._fixtures)
+
+    @property
+    def loading(self):
+        '''Whether any Fixtures are still being prepped on the loader pool.'''
+        return bool(self._pending)
+
+    def wait_all(self):
+        '''Prep the Fixtures of every patch, and return them all (keyed by patch id).'''
+        self.prep_all()
+        for patch_id in list(self._pending):
+            self.fixture(patch_id)
+        return self._fixtures
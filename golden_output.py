@@ -0,0 +1,335 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Golden-output and throughput checks of the fixture library's message building.
+
+Builds every command of every fixture in the library (unstable definitions
+included) over a representative grid of argument values, and compares the
+resulting bytes against stored snapshots:
+
+    python golden_output.py --update   # Record snapshots
+    python golden_output.py            # Compare against them
+
+Snapshots live in `golden_snapshots/`, beside this script: one JSON file per
+fixture id, named `<fixture_id>.json`. (Another directory may be given as an
+argument.) As the fixture library isn't publicly available, none are shipped:
+record them with `--update` against a known-good version of the library, and
+re-record them deliberately when a change to its output is intended.
+
+Anything that caches or precompiles messages should produce output
+byte-identical to what is built here. With `--bundle`, each case is also
+passed through a compiled command bundle (`command_bundle.CommandBundle`,
+saved and reloaded), and what the bundle serves is checked to be
+byte-identical to building the command directly. This needs no snapshots.
+
+Fixtures are built in parallel, sharded across a pool of processes. The
+number of commands built per second is reported for each fixture.
+
+Deliberately standalone (it imports no more of the plugin than the bundle
+modules, and not LiSP), so it can be run wherever the fixture library and
+mido are installed.
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from itertools import islice, product
+import json
+import os
+import sys
+import tempfile
+from time import perf_counter
+from types import ModuleType
+
+import mido
+
+from midi_fixture_library import Catalogue, Fixture
+
+# Addresses fixtures are built at.
+CHANNEL = 0
+DEVICEID = 1
+
+# Most argument combinations built (and recorded) per command.
+MAX_CASES = 64
+
+# Number of times each fixture's cases are built, when measuring throughput.
+REPEATS = 5
+
+TEXT_SAMPLES = ['', 'A', 'Test 123']
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden_snapshots')
+
+# Name the plugin's own modules are imported under (see `_plugin_module`).
+PLUGIN_PACKAGE = '_midi_fixture_control'
+
+# Output and patch the bundle check files its cases under.
+BUNDLE_OUTPUT = 'golden'
+BUNDLE_PATCH = 'golden'
+
+def _plugin_module(name):
+    '''Imports one of the plugin's modules, without the package's `__init__` (and so LiSP).'''
+    if PLUGIN_PACKAGE not in sys.modules:
+        package = ModuleType(PLUGIN_PACKAGE)
+        package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+        sys.modules[PLUGIN_PACKAGE] = package
+    return import_module('{0}.{1}'.format(PLUGIN_PACKAGE, name))
+
+def _spread(values, count=5):
+    '''Returns up to `count` values, evenly spread across (and including the ends of) `values`.'''
+    values = list(values)
+    if len(values) <= count:
+        return values
+    step = (len(values) - 1) / (count - 1)
+    return [values[round(idx * step)] for idx in range(count)]
+
+def _samples(definition, values):
+    '''Returns representative values of one argument, given its definition and allowed values.'''
+    if definition['type'] in ('numeric', 'slider'):
+        low, high = values
+        middle = (low + high) // 2 if definition['type'] == 'numeric' else (low + high) / 2
+        return sorted({low, middle, high})
+    if definition['type'] == 'dropdown':
+        return _spread(values)
+    if definition['type'] == 'textual':
+        return TEXT_SAMPLES
+    return []
+
+def argument_grid(profile, command):
+    '''Yields argument dicts covering the representative values of each of a command's arguments.
+
+    Arguments whose values are conditional on another argument are sampled
+    for each value of the argument they depend on.
+    '''
+    definitions = profile.parameters()
+    values = profile.parameter_values(command)
+
+    independent = [name for name in values if 'valuesConditionalOn' not in definitions[name]]
+    dependent = [name for name in values if 'valuesConditionalOn' in definitions[name]]
+
+    for base in product(*[_samples(definitions[name], values[name]) for name in independent]):
+        args = dict(zip(independent, base))
+        dependent_samples = []
+        for name in dependent:
+            transmitter = args.get(definitions[name]['valuesConditionalOn'])
+            conditional_values = values[name].get(transmitter) if transmitter is not None else None
+            dependent_samples.append(
+                _samples(definitions[name], conditional_values) if conditional_values else [None])
+        for extra in product(*dependent_samples):
+            yield dict(args, **{name: value for name, value in zip(dependent, extra)
+                                if value is not None})
+
+def build_cases(fixture):
+    '''Returns `(command, args)` for every case to be built of a fixture.'''
+    cases = []
+    for command in fixture.command_list:
+        cases.extend((command, args) for args in islice(argument_grid(fixture, command), MAX_CASES))
+    return cases
+
+def build_bytes(fixture, command, args):
+    '''Builds a command as this plugin does (cf. `MidiFixtureControl.build_commands`).'''
+    return [mido.Message.from_dict(message).hex()
+            for message in fixture.build_command(command, args)]
+
+def bundle_mismatches(fixture, cases):
+    '''Passes built cases through a saved and reloaded command bundle.
+
+    Returns a list of the cases the bundle doesn't serve byte-identically to
+    building the command directly.
+    '''
+    command_bundle = _plugin_module('command_bundle')
+    command_messages = _plugin_module('command_messages')
+
+    bundle = command_bundle.CommandBundle(None)
+    commands = {}
+    for idx, case in enumerate(cases):
+        cue_id = str(idx)
+        commands[cue_id] = {'patch_id': BUNDLE_PATCH, 'command': case['command'],
+                            'args': case['args']}
+        messages = command_messages.CommandMessages()
+        messages.extend(BUNDLE_OUTPUT, BUNDLE_PATCH,
+                        [mido.Message.from_dict(message)
+                         for message in fixture.build_command(case['command'], case['args'])])
+        bundle.add(cue_id, commands[cue_id], messages)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'golden.fixtures.json')
+        bundle.save(path)
+        bundle = command_bundle.CommandBundle.load(path)
+
+    mismatches = []
+    for idx, case in enumerate(cases):
+        messages = bundle.messages(str(idx), commands[str(idx)]) if bundle is not None else None
+        served = [message.hex() for message in messages.get(BUNDLE_OUTPUT, [])] \
+            if messages is not None else None
+        if served != case['bytes']:
+            mismatches.append('{0} {1}: built {2}, bundle served {3}'.format(
+                case['command'], json.dumps(case['args'], sort_keys=True),
+                case['bytes'], served))
+    return mismatches
+
+def run_fixture(fixture_id, requires_channel, requires_deviceid, check_bundle=False):
+    '''Builds every case of one fixture. Run in a worker process.
+
+    Returns a dict of the fixture's cases (each with its built bytes, or the
+    error raised building it) and its throughput. If `check_bundle` is set,
+    it also has the cases a command bundle doesn't serve identically.
+    '''
+    fixture = Fixture(fixture_id,
+                      channel=CHANNEL if requires_channel else None,
+                      deviceid=DEVICEID if requires_deviceid else None)
+    cases = build_cases(fixture)
+
+    results = []
+    for command, args in cases:
+        try:
+            results.append({'command': command, 'args': args,
+                            'bytes': build_bytes(fixture, command, args)})
+        except Exception as error: # pylint: disable=broad-except
+            results.append({'command': command, 'args': args,
+                            'error': '{0}: {1}'.format(type(error).__name__, error)})
+
+    buildable = [(command, args) for (command, args), result in zip(cases, results)
+                 if 'bytes' in result]
+    started = perf_counter()
+    for _ in range(REPEATS):
+        for command, args in buildable:
+            build_bytes(fixture, command, args)
+    elapsed = perf_counter() - started
+
+    result = {
+        'fixture_id': fixture_id,
+        'cases': results,
+        'commands_per_second': len(buildable) * REPEATS / elapsed if elapsed else None,
+    }
+    if check_bundle:
+        result['bundle_mismatches'] = bundle_mismatches(
+            fixture, [case for case in results if 'bytes' in case])
+    return result
+
+def snapshot_path(directory, fixture_id):
+    return os.path.join(directory, '{0}.json'.format(fixture_id))
+
+def compare(expected, actual):
+    '''Returns a list of differences between a stored snapshot and a fresh run of a fixture.'''
+    def key(case):
+        return (case['command'], json.dumps(case['args'], sort_keys=True))
+
+    expected_cases = {key(case): case for case in expected['cases']}
+    actual_cases = {key(case): case for case in actual['cases']}
+    differences = []
+    for case_key in sorted(set(expected_cases) | set(actual_cases)):
+        old = expected_cases.get(case_key)
+        new = actual_cases.get(case_key)
+        if old is None:
+            differences.append('new case {0} {1}'.format(*case_key))
+        elif new is None:
+            differences.append('missing case {0} {1}'.format(*case_key))
+        elif old.get('bytes') != new.get('bytes') or old.get('error') != new.get('error'):
+            differences.append('{0} {1}: expected {2}, got {3}'.format(
+                case_key[0], case_key[1],
+                old.get('bytes', old.get('error')), new.get('bytes', new.get('error'))))
+    return differences
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('directory', nargs='?', default=DEFAULT_DIRECTORY,
+                        help='Directory of golden snapshots (default: %(default)s)')
+    parser.add_argument('--update', action='store_true',
+                        help='Record snapshots, rather than compare against them')
+    parser.add_argument('--bundle', action='store_true',
+                        help='Compare what a command bundle serves against building directly, '
+                             'rather than against snapshots')
+    parser.add_argument('--fixture', action='append', dest='fixtures', metavar='FIXTURE_ID',
+                        help='Only check this fixture (may be given more than once)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    options = parser.parse_args(argv)
+
+    catalogue = Catalogue(include_unstable=True)
+    devices = catalogue.devices(None, None, None)
+    fixture_ids = sorted(options.fixtures or devices)
+
+    jobs = []
+    for fixture_id in fixture_ids:
+        description = catalogue.device_description(fixture_id)
+        jobs.append((fixture_id,
+                     description['requiresMidiChannel'],
+                     description['requiresMidiDeviceID'],
+                     options.bundle))
+
+    if options.update:
+        os.makedirs(options.directory, exist_ok=True)
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=options.jobs) as pool:
+        chunksize = max(1, len(jobs) // (4 * (options.jobs or 1)))
+        results = pool.map(run_fixture, *zip(*jobs), chunksize=chunksize)
+        for result in results:
+            fixture_id = result['fixture_id']
+            throughput = result['commands_per_second']
+            rate = '{0:>10} commands/s'.format(round(throughput) if throughput else '-')
+            path = snapshot_path(options.directory, fixture_id)
+
+            if options.bundle:
+                mismatches = result['bundle_mismatches']
+                if mismatches:
+                    failures += 1
+                    print('{0}  {1}  {2} BUNDLE MISMATCHES'.format(
+                        rate, fixture_id, len(mismatches)))
+                    for mismatch in mismatches:
+                        print('    ' + mismatch)
+                else:
+                    print('{0}  {1}  bundle ok'.format(rate, fixture_id))
+                continue
+
+            if options.update:
+                with open(path, 'w', encoding='utf-8') as file:
+                    json.dump({'fixture_id': fixture_id, 'cases': result['cases']},
+                              file, indent=1, sort_keys=True)
+                print('{0}  {1}  recorded {2} cases'.format(rate, fixture_id, len(result['cases'])))
+                continue
+
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    expected = json.load(file)
+            except (OSError, ValueError):
+                failures += 1
+                print('{0}  {1}  NO SNAPSHOT'.format(rate, fixture_id))
+                continue
+
+            differences = compare(expected, result)
+            if differences:
+                failures += 1
+                print('{0}  {1}  {2} DIFFERENCES'.format(rate, fixture_id, len(differences)))
+                for difference in differences:
+                    print('    ' + difference)
+            else:
+                print('{0}  {1}  ok'.format(rate, fixture_id))
+
+    if options.bundle:
+        print('{0} of {1} fixtures are served differently by a bundle.'.format(failures, len(jobs)))
+    elif not options.update:
+        print('{0} of {1} fixtures differ from their snapshots.'.format(failures, len(jobs)))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import re
+
+# pylint: disable=no-name-in-module
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from .command_bundle import library_files, library_locations
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Files that aren't fixture definitions, and may be ignored.
+IGNORED_SUFFIXES = ('.pyc', '.pyo', '~', '.swp', '.tmp')
+
+def _normalise(text):
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+def fixtures_affected_by(paths, fixture_ids):
+    '''Returns which of `fixture_ids` are defined by the given (changed) library files.
+
+    The library doesn't say which files a fixture is defined by, so this goes
+    by name: a file defines the fixtures whose id contains its name. A file
+    named for none of them (e.g. one shared by a manufacturer's devices)
+    affects those whose id contains the name of its directory. A file that
+    can't be matched to any (e.g. a shared include) may affect any of them,
+    so all are returned.
+
+    Returns `None` if library code has changed, which can't be reloaded.
+    '''
+    fixture_ids = {fixture_id: _normalise(fixture_id) for fixture_id in fixture_ids}
+    affected = set()
+    for path in paths:
+        if path.endswith('.py'):
+            return None
+
+        for name in (os.path.splitext(os.path.basename(path))[0],
+                     os.path.basename(os.path.dirname(path))):
+            name = _normalise(name)
+            matched = {fixture_id for fixture_id, normalised in fixture_ids.items()
+                       if name and name in normalised}
+            if matched:
+                affected.update(matched)
+                break
+        else:
+            return set(fixture_ids)
+    return affected
+
+class LibraryWatcher(QObject):
+    '''Watches the installed fixture library's files, reporting any that change.
+
+    Editors often save by replacing a file, so directories are watched as
+    well as files, and changes are found by comparing each file's size and
+    modification time with those last seen. Bursts of changes (e.g. a save,
+    or a `git pull`) are gathered up and reported together.
+    '''
+
+    # Emitted with a list of the paths added, changed or removed.
+    changed = pyqtSignal(list)
+
+    def __init__(self, delay=500, parent=None):
+        super().__init__(parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._schedule)
+        self._watcher.fileChanged.connect(self._schedule)
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._rescan)
+
+        self._seen = {}
+
+    def start(self):
+        self._seen = self._scan()
+        self._watch()
+
+    def stop(self):
+        self._timer.stop()
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+
+    @staticmethod
+    def _scan():
+        seen = {}
+        for location in library_locations():
+            seen[location] = None
+            for root, filename in library_files(location):
+                seen[root] = None
+                if filename.endswith(IGNORED_SUFFIXES):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen[path] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def _watch(self):
+        watched = set(self._watcher.files() + self._watcher.directories())
+        wanted = [path for path in self._seen if path not in watched]
+        if wanted:
+            self._watcher.addPaths(wanted)
+
+    def _schedule(self, _=None):
+        self._timer.start()
+
+    def _rescan(self):
+        seen = self._scan()
+        changed = sorted(path for path in set(seen) | set(self._seen)
+                         if seen.get(path) != self._seen.get(path)
+                         and (seen.get(path) or self._seen.get(path)))
+        self._seen = seen
+        # Replaced files (and new directories) need watching afresh.
+        self._watch()
+
+        if changed:
+            logger.debug('Fixture library files changed: %s', changed)
+            self.changed.emit(changed)
@@ -0,0 +1,173 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+'''A stand-in for LiSP's `Midi` plugin, for running this plugin headless.
+
+    from midi_fixture_control.loopback_midi import LoopbackMidi
+
+    midi = LoopbackMidi(['desk', 'amp'])
+    midi.install()   # Before MidiFixtureControl is loaded.
+    ...
+    midi.wait_for('desk', 4)
+    assert midi.sent_bytes('desk') == [...]
+
+Everything sent is recorded (bytes, and the time it was sent on the clock
+of `send_scheduler.now()`) so that both what is sent and when can be
+checked. Outputs can also be made to fail or to block, to exercise the
+output watchdog.
+'''
+
+import logging
+from threading import Condition
+from time import sleep
+
+from .send_scheduler import now
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class SentMessage:
+    '''A message, as received by a LoopbackMidi output.'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, timestamp, midi_patch_id, message):
+        self.timestamp = timestamp
+        self.midi_patch_id = midi_patch_id
+        self.message = message
+        self.bytes = bytes(message.bytes())
+
+    def __repr__(self):
+        return '<SentMessage {0:.6f} {1} {2}>'.format(self.timestamp, self.midi_patch_id,
+                                                      self.bytes.hex(' '))
+
+class LoopbackMidi:
+    '''Provides what this plugin uses of LiSP's `Midi` plugin, recording what's sent in memory.
+
+    If `virtual` is set, each output is also opened as a virtual MIDI port
+    (e.g. an ALSA sequencer port on Linux) of the same name, so what's sent
+    can be watched with external tools. This needs a mido backend that
+    supports virtual ports, such as python-rtmidi.
+    '''
+
+    def __init__(self, outputs=('loopback',), virtual=False):
+        self._outputs = {midi_patch_id: 'Loopback: {0}'.format(midi_patch_id)
+                         for midi_patch_id in outputs}
+        self._condition = Condition()
+        self._sent = []
+        self._failing = {}
+        self._stalls = {}
+        self._ports = {}
+        if virtual:
+            self._open_virtual_ports()
+
+    def _open_virtual_ports(self):
+        import mido # pylint: disable=import-outside-toplevel
+        for midi_patch_id, name in self._outputs.items():
+            try:
+                self._ports[midi_patch_id] = mido.open_output(name, virtual=True)
+            except (IOError, NotImplementedError):
+                logger.warning('Unable to open virtual MIDI port "%s"; recording in memory only.',
+                               name)
+
+    # Standing in for lisp.core.plugin.Plugin
+
+    @staticmethod
+    def is_loaded():
+        return True
+
+    def install(self):
+        '''Make this what `get_plugin('Midi')` returns. Returns what it returned before.'''
+        from lisp import plugins # pylint: disable=import-outside-toplevel, import-error
+        previous = plugins.PLUGINS.get('Midi')
+        plugins.PLUGINS['Midi'] = self
+        return previous
+
+    def close(self):
+        for port in self._ports.values():
+            port.close()
+        self._ports = {}
+
+    # Standing in for lisp.plugins.midi.Midi
+
+    def output_patches(self):
+        return dict(self._outputs)
+
+    def output_name_formatted(self, midi_patch_id):
+        return self._outputs.get(midi_patch_id, midi_patch_id)
+
+    def send(self, midi_patch_id, message):
+        if midi_patch_id not in self._outputs:
+            raise KeyError(midi_patch_id)
+
+        stall = self._stalls.get(midi_patch_id)
+        if stall:
+            sleep(stall)
+        error = self._failing.get(midi_patch_id)
+        if error is not None:
+            raise error
+
+        sent = SentMessage(now(), midi_patch_id, message)
+        if midi_patch_id in self._ports:
+            self._ports[midi_patch_id].send(message)
+        with self._condition:
+            self._sent.append(sent)
+            self._condition.notify_all()
+
+    # Inspection
+
+    def sent(self, midi_patch_id=None):
+        '''Returns the `SentMessage`s received (by an output, or by all), in the order received.'''
+        with self._condition:
+            return [sent for sent in self._sent
+                    if midi_patch_id is None or sent.midi_patch_id == midi_patch_id]
+
+    def sent_bytes(self, midi_patch_id=None):
+        '''Returns the bytes of each message received (by an output, or by all).'''
+        return [sent.bytes for sent in self.sent(midi_patch_id)]
+
+    def wait_for(self, midi_patch_id=None, count=1, timeout=5.0):
+        '''Wait until at least `count` messages have been received. Returns whether they were.
+
+        Sends are made from each output's own thread, so may arrive a little
+        after whatever caused them returns.
+        '''
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: len([sent for sent in self._sent if midi_patch_id is None
+                             or sent.midi_patch_id == midi_patch_id]) >= count,
+                timeout)
+
+    def clear(self):
+        with self._condition:
+            self._sent = []
+
+    # Fault injection
+
+    def disconnect(self, midi_patch_id, error=None):
+        '''Make sends to an output fail (with `error`, an exception), until `reconnect`ed.'''
+        self._failing[midi_patch_id] = error or OSError('Loopback output disconnected')
+
+    def reconnect(self, midi_patch_id):
+        self._failing.pop(midi_patch_id, None)
+
+    def stall(self, midi_patch_id, seconds):
+        '''Make each send to an output block for `seconds` (0 to stop doing so).'''
+        self._stalls[midi_patch_id] = seconds
@@ -21,18 +21,38 @@
 # along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import os
 
 # pylint: disable=no-name-in-module
-from PyQt5.QtCore import QT_TRANSLATE_NOOP
-
-from midi_fixture_library import Fixture, FixtureWidthError
+from PyQt5.QtCore import QT_TRANSLATE_NOOP, QTimer
+from PyQt5.QtWidgets import QAction
 
 # pylint: disable=import-error
 from lisp.core.plugin import Plugin
+from lisp.core.signal import Signal
+from lisp.plugins import get_plugin
+from lisp.plugins.midi.midi_utils import midi_from_dict
+from lisp.ui.settings.app_configuration import AppConfigurationDialog
 from lisp.ui.settings.session_configuration import SessionConfigurationDialog
+from lisp.ui.ui_utils import translate
 
+from .command_bundle import CommandBundle, bundle_path, library_fingerprint, patch_fingerprint
+from .command_messages import CommandMessages
+from .dca_assignments import DcaAssignmentMatrix
 from .fixture_command_cue import FixtureCommandCue
+from .fixture_registry import FixtureRegistry, forget_catalogues
+from .library_watcher import LibraryWatcher, fixtures_affected_by
+from .midi_fixture_preferences import MidiFixturePreferences
+from .midi_fixture_select import reset_catalogue_index
 from .midi_fixture_settings import MidiFixtureSettings
+from .midi_fixture_status import TrafficStatusDialog
+from .output_coalescer import OutputCoalescer
+from .output_watchdog import OutputState, OutputWatchdog
+from .profiling import configure as configure_profiling, profiled
+from .send_scheduler import SendScheduler
+from .state_store import MIDI_LINK_RATE, OutputStateStore
+from .traffic_metrics import TrafficMetrics, default_metrics_path
+from .ui import PatchListModel, forget_command_indices
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
@@ -44,12 +64,19 @@ class MidiFixtureControl(Plugin):
     Depends = ('Midi',)
     Description = 'Provides the ability to control a pre-identified MIDI fixture'
 
+    # The fixture library commands used to (un)assign a channel to/from a DCA.
+    # Both take `channel` and `dca` arguments.
+    DcaAssignCommand = 'dcaAssign'
+    DcaUnassignCommand = 'dcaUnassign'
+
     def __init__(self, app):
         super().__init__(app)
 
-        # Register the settings widget
+        # Register the settings widgets
         SessionConfigurationDialog.registerSettingsPage(
             'midi_fixture_control', MidiFixtureSettings, self)
+        AppConfigurationDialog.registerSettingsPage(
+            'plugins.midi_fixture_control', MidiFixturePreferences, MidiFixtureControl.Config)
 
         # Register the Fixture Command cue type
         app.cue_factory.register_factory(FixtureCommandCue.__name__, FixtureCommandCue)
@@ -57,52 +84,497 @@ class MidiFixtureControl(Plugin):
             FixtureCommandCue, QT_TRANSLATE_NOOP("CueCategory", "Integration cues")
         )
 
-        self.fixtures = {}
+        # Compiled-command bundle menu entry
+        self._compile_action = QAction(app.window)
+        self._compile_action.setText(translate('MidiFixtureControl', 'Compile Fixture Commands'))
+        self._compile_action.triggered.connect(self.compile_bundle)
+        app.window.menuTools.addAction(self._compile_action)
+
+        # Traffic status panel menu entry
+        self._status_dialog = None
+        self._status_action = QAction(app.window)
+        self._status_action.setText(translate('MidiFixtureControl', 'MIDI Fixture Traffic'))
+        self._status_action.triggered.connect(self.show_status)
+        app.window.menuTools.addAction(self._status_action)
+
+        # Resynchronisation menu entry
+        self._resync_action = QAction(app.window)
+        self._resync_action.setText(translate('MidiFixtureControl', 'Resync MIDI Fixtures'))
+        self._resync_action.triggered.connect(lambda: self.resync())
+        app.window.menuTools.addAction(self._resync_action)
+
+        self._midi = get_plugin('Midi')
+        # Replaced (never modified) whenever the patch changes; see FixtureRegistry.
+        self._registry = FixtureRegistry()
+
+        self._bundle = None
+        self._bundle_checked = False
+        # The bundle file last read (path and modification time), and what was
+        # read from it: kept so that patch edits needn't re-read it.
+        self._bundle_file = None
+        self._loaded_bundle = None
+        # Fingerprinting the library means visiting every file of it, so it's
+        # only done once, and again only when the library is seen to change.
+        self._library_fingerprint = None
+
+        self.metrics = TrafficMetrics()
+        self._metrics_timer = QTimer()
+        self._metrics_timer.timeout.connect(self._write_metrics)
+
+        # Every send ends up here: each MIDI output gets its own sending thread,
+        # so that a blocked or vanished output can't hold up the others.
+        self._outputs = OutputWatchdog(self._midi.send, self.metrics,
+                                       self._on_output_sent, self._on_output_state_changed)
+        # What was last sent to each fixture, so it can be restored.
+        self.state_store = OutputStateStore()
+        self.scheduler = SendScheduler(self._send, self.metrics.set_queue_depth)
+        self._coalescer = OutputCoalescer(self._send)
+
+        # Cues that can prepare themselves for being started (i.e. have an
+        # `arm()` method) are armed when they become the standby cue.
+        self._standby_cue = None
+        self._standby_timer = QTimer()
+        self._standby_timer.setInterval(100)
+        self._standby_timer.timeout.connect(self._check_standby_cue)
+
+        self._dca_matrix = DcaAssignmentMatrix()
+        self._dca_device = None
+
+        # Shared by every PatchSelector; kept up to date as the patch changes.
+        self._patch_list_model = PatchListModel()
+        self._patch_list_dirty = True
+
+        # Whilst fixtures are still loading, the patch list is filled in with
+        # them as they become ready, rather than waiting for them all.
+        self._patch_list_timer = QTimer()
+        self._patch_list_timer.setSingleShot(True)
+        self._patch_list_timer.setInterval(100)
+        self._patch_list_timer.timeout.connect(lambda: self.patch_list_model)
+
+        # Reloads fixture definitions as they're edited (if enabled).
+        # Emitted with the ids of the fixture definitions reloaded.
+        self.fixtures_reloaded = Signal()
+        self._library_watcher = LibraryWatcher()
+        self._library_watcher.changed.connect(self._on_library_changed)
+
+        self._apply_config()
+        MidiFixtureControl.Config.updated.connect(self._apply_config)
+
+    def _apply_config(self, _=None):
+        configure_profiling(
+            enabled=self.Config.get('profiling.enabled', False),
+            directory=self.Config.get('profiling.directory', ''),
+            keep=self.Config.get('profiling.keep', 50))
+
+        self._coalescer.configure(self.Config.get('coalescing.window', 0),
+                                  self.Config.get('coalescing.outputs', {}))
+
+        self._outputs.configure(
+            deadline=max(1, self.Config.get('watchdog.deadline', 500)) / 1000,
+            retry_interval=max(100, self.Config.get('watchdog.retry_interval', 2000)) / 1000,
+            mode=self.Config.get('watchdog.mode', 'buffer'),
+            buffer_limit=max(1, self.Config.get('watchdog.buffer_limit', 1024)),
+            on_recovery=self.Config.get('watchdog.on_recovery', 'flush'))
+
+        self._library_watcher.stop()
+        if self.Config.get('library.watch', False):
+            self._library_watcher.start()
+
+        self._metrics_timer.stop()
+        if self.Config.get('metrics.enabled', False):
+            self._metrics_timer.setInterval(max(1, self.Config.get('metrics.interval', 10)) * 1000)
+            self._metrics_timer.start()
+
+    def _write_metrics(self):
+        file_format = self.Config.get('metrics.format', 'json')
+        path = self.Config.get('metrics.path', '') or default_metrics_path(file_format)
+        try:
+            self.metrics.write(path, file_format)
+        except OSError:
+            logger.exception('Unable to write MIDI fixture traffic metrics to %s', path)
+
+    def show_status(self):
+        '''Show the traffic status panel.'''
+        if self._status_dialog is None:
+            self._status_dialog = TrafficStatusDialog(self, parent=self.app.window)
+        self._status_dialog.show()
+        self._status_dialog.raise_()
+
+    def finalize(self):
+        self._library_watcher.stop()
+        self._metrics_timer.stop()
+        self._standby_timer.stop()
+        self._patch_list_timer.stop()
+        self._coalescer.flush_all()
+        self.scheduler.stop()
+        self._outputs.stop()
+        super().finalize()
 
     def _on_session_initialised(self):
+        self._standby_cue = None
+        self.state_store.clear()
         self._on_session_config_altered(None)
+        self._standby_timer.start()
+
+    def _check_standby_cue(self):
+        # Only layouts with the concept of a "next" cue (e.g. the List Layout) have this.
+        standby_cue = getattr(getattr(self.app, 'layout', None), 'standby_cue', None)
+        if standby_cue is None:
+            return
+
+        cue = standby_cue()
+        if cue is self._standby_cue:
+            return
+        self._standby_cue = cue
+
+        arm = getattr(cue, 'arm', None)
+        if callable(arm):
+            try:
+                arm()
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Unable to arm cue "%s"', cue.name)
+
+    @property
+    def registry(self):
+        '''The current (consistent, unchanging) snapshot of the patch. Read it once, then use that.'''
+        return self._registry
+
+    @property
+    def fixtures(self):
+        '''The currently prepped Fixtures, keyed by patch id.'''
+        return self._registry.fixtures
+
+    @property
+    def patch_generation(self):
+        '''Changes whenever the patch changes, so anything derived from it can tell it's stale.'''
+        return self._registry.generation
 
     def get_patched_output(self, patch_id):
-        for patch in self.SessionConfig.get('patches'):
-            if patch["patch_id"] == patch_id:
-                return patch["midi_patch_id"]
-        return None
+        return self._registry.outputs.get(patch_id)
 
     def get_profile(self, patch_id=None):
         if patch_id is None:
             if self.SessionConfig['default_patch']:
-                return self.fixtures[self.SessionConfig['default_patch']]
+                return self._registry.fixture(self.SessionConfig['default_patch'])
             return None
 
-        if patch_id not in self.fixtures:
+        fixture = self._registry.fixture(patch_id)
+        if fixture is None:
             logger.warning('Patch ID "%s" not in prepped fixtures.', {patch_id})
+        return fixture
+
+    @property
+    def patch_list_model(self):
+        '''The list of patched fixtures, as shared by every PatchSelector.'''
+        if self._patch_list_dirty:
+            registry = self._registry
+            registry.prep_all()
+            self._patch_list_model.update(registry.patches.values(), registry.ready())
+            self._patch_list_dirty = registry.loading
+            if self._patch_list_dirty:
+                self._patch_list_timer.start()
+        return self._patch_list_model
+
+    def build_commands(self, commands):
+        '''Resolve and build a batch of fixture commands.
+
+        `commands` is an iterable of `(patch_id, command, args)` entries.
+
+        Returns a dict, keyed by MIDI output patch id, of lists of MIDI messages
+        ready to be sent. Messages destined for the same output remain in the
+        order their commands were given. Entries that can't be resolved (or
+        built) are logged and skipped; the rest of the batch is unaffected.
+        '''
+        registry = self._registry
+        messages = CommandMessages()
+        for patch_id, command, args in commands:
+            midi_patch_id = registry.outputs.get(patch_id)
+            profile = registry.fixture(patch_id)
+            if midi_patch_id is None or profile is None:
+                logger.warning('Patch ID "%s" not in prepped fixtures.', {patch_id})
+                continue
+
+            try:
+                block = [midi_from_dict(dict_message)
+                         for dict_message in profile.build_command(command, args)]
+            except Exception: # pylint: disable=broad-except
+                logger.exception('Unable to build command "%s" of patch "%s"', command, patch_id)
+                continue
+
+            messages.extend(midi_patch_id, patch_id, block)
+            messages.commands.append((patch_id, command, args))
+
+        return messages
+
+    def dispatch(self, messages, timestamp=None):
+        '''Send built MIDI messages, as returned by `build_commands`.
+
+        If a `timestamp` is given (on the clock of `send_scheduler.now()`) the
+        messages are held back and released by the scheduler at that time.
+
+        Otherwise, they are sent now; unless the output has a coalescing window
+        configured, in which case they are merged with anything else sent to
+        that output within the window (see `OutputCoalescer`).
+        '''
+        self._track_dca_commands(getattr(messages, 'commands', ()))
+
+        all_sources = getattr(messages, 'sources', {})
+        for midi_patch_id, output_messages in messages.items():
+            sources = all_sources.get(midi_patch_id)
+            if timestamp is None:
+                self._coalescer.submit(midi_patch_id, output_messages, sources)
+            else:
+                self.scheduler.schedule(timestamp, midi_patch_id, output_messages, sources)
+
+    def _track_dca_commands(self, commands):
+        '''Keep the DCA assignment matrix up to date with DCA commands sent by anything.
+
+        An (un)assignment that can't be followed (i.e. isn't for one channel
+        and one DCA) leaves the device's assignments unknown.
+        '''
+        dca_device = self.SessionConfig['dca_device']
+        actions = {
+            self.DcaAssignCommand: DcaAssignmentMatrix.ASSIGN,
+            self.DcaUnassignCommand: DcaAssignmentMatrix.UNASSIGN,
+        }
+        for patch_id, command, args in commands:
+            if patch_id != dca_device or command not in actions:
+                continue
+            channel = args.get('channel') if isinstance(args, dict) else None
+            dca = args.get('dca') if isinstance(args, dict) else None
+            if isinstance(channel, int) and isinstance(dca, int):
+                self._dca_matrix.apply([(actions[command], channel, dca)])
+            else:
+                self._dca_matrix.reset()
+
+    def _send(self, midi_patch_id, messages, sources=None):
+        # Sending (and counting what's sent) is done by the output's own thread.
+        self.state_store.record(midi_patch_id, messages, sources)
+        self._outputs.submit(midi_patch_id, messages, sources)
+
+    def _on_output_sent(self, midi_patch_id, messages, sources):
+        self.state_store.mark_delivered(midi_patch_id, messages, sources)
+
+    def _on_output_state_changed(self, midi_patch_id, state, previous=None):
+        if state is OutputState.Disconnected:
+            # Whatever's on the other end may have lost its state too.
+            self.state_store.invalidate(midi_patch_id)
+        elif previous is OutputState.Disconnected and self.Config.get('resync.on_reconnect', True):
+            self.resync(midi_patch_id, full=False)
+
+    def resync(self, midi_patch_id=None, full=True):
+        '''Re-send the last-sent state of every fixture on an output (or on all outputs).
+
+        Only the most recent command for each fixture parameter is sent, in
+        the order they were originally sent, paced to the configured link
+        rate. If `full` is not set, anything known to have reached the output
+        since it last reconnected is skipped.
+        '''
+        rate = max(1, self.Config.get('resync.rate', MIDI_LINK_RATE))
+        for output_id in [midi_patch_id] if midi_patch_id else self.state_store.outputs():
+            self.state_store.resync(output_id, self._outputs.submit, rate, full)
+
+    def output_state(self, midi_patch_id):
+        '''Returns whether an output is healthy, stalled or disconnected (an `OutputState`).'''
+        return self._outputs.state(midi_patch_id)
+
+    def send_commands(self, commands, timestamp=None):
+        '''Resolve, build and send a batch of fixture commands.
+
+        This is the entry point for other plugins (and scripts) wishing to
+        control patched fixtures; see `build_commands` for the format of
+        `commands`, and `dispatch` for the meaning of `timestamp`.
+        '''
+        self.dispatch(self.build_commands(commands), timestamp)
+
+    def _fingerprint(self):
+        if self._library_fingerprint is None:
+            self._library_fingerprint = library_fingerprint()
+        return '{0}:{1}'.format(patch_fingerprint(self.SessionConfig['patches']),
+                                self._library_fingerprint)
+
+    def _session_file(self):
+        session = getattr(self.app, 'session', None)
+        return session.session_file if session is not None else ''
+
+    def _load_bundle(self):
+        '''Loads the session's compiled-command bundle, if it exists and is still valid.'''
+        self._bundle_checked = True
+        self._bundle = None
+
+        session_file = self._session_file()
+        if not session_file:
+            return False
+
+        path = bundle_path(session_file)
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            modified = None
+        if self._bundle_file != (path, modified):
+            self._bundle_file = (path, modified)
+            self._loaded_bundle = CommandBundle.load(path) if modified is not None else None
+
+        bundle = self._loaded_bundle
+        if bundle is None:
+            return False
+
+        if bundle.fingerprint != self._fingerprint():
+            logger.debug('Fixture command bundle is out of date; ignoring it.')
+            return False
+
+        self._bundle = bundle
+        return True
+
+    def compiled_messages(self, cue):
+        '''Returns a cue's messages from the session's bundle, or `None` if not available.'''
+        if not self._bundle_checked:
+            self._load_bundle()
+        if self._bundle is None:
             return None
+        return self._bundle.messages(cue.id, cue.fixture_command)
 
-        return self.fixtures[patch_id]
+    def compile_bundle(self):
+        '''Builds every Fixture Command cue, and saves the results next to the session file.'''
+        session_file = self._session_file()
+        if not session_file:
+            logger.warning(translate(
+                'MidiFixtureControl',
+                'The session must be saved before its fixture commands can be compiled.'))
+            return
 
-    def _on_session_config_altered(self, _):
-        for patch in self.SessionConfig['patches']:
-            patch_id = patch['patch_id']
-
-            if patch_id not in self.fixtures:
-                self.fixtures[patch_id] = Fixture(
-                    patch['fixture_id'],
-                    channel=patch['midi_channel'] if 'midi_channel' in patch else None,
-                    deviceid=patch['midi_deviceid'] if 'midi_deviceid' in patch else None
-                )
+        bundle = CommandBundle(self._fingerprint())
+        for cue in self.app.cue_model:
+            if not isinstance(cue, FixtureCommandCue):
                 continue
+            command = cue.fixture_command
+            if not command or not command['patch_id']:
+                continue
+            bundle.add(cue.id,
+                       command,
+                       self.build_commands([(command['patch_id'], command['command'], command['args'])]))
+
+        path = bundle_path(session_file)
+        try:
+            bundle.save(path)
+        except OSError:
+            logger.exception(translate('MidiFixtureControl', 'Unable to save fixture command bundle.'))
+            return
+
+        self._bundle = bundle
+        self._bundle_checked = True
+        self._loaded_bundle = bundle
+        try:
+            self._bundle_file = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            self._bundle_file = None
+        logger.info(translate('MidiFixtureControl', 'Compiled %d fixture command cues to %s'),
+                    len(bundle), path)
+
+    def _on_library_changed(self, paths):
+        registry = self._registry
+        affected = fixtures_affected_by(
+            paths, {patch['fixture_id'] for patch in registry.patches.values()})
+        if affected is None:
+            logger.warning(translate(
+                'MidiFixtureControl',
+                'The fixture library itself has changed; restart to use the new version.'))
+            return
+
+        self._library_fingerprint = None
+
+        # Fixture descriptions may have changed, so reload the catalogues
+        # (when they're next needed).
+        forget_catalogues()
+        reset_catalogue_index()
+        forget_command_indices(affected)
+
+        if affected:
+            registry = registry.reload(affected)
+            if self._bundle is None:
+                registry.prep_all()
+            else:
+                self._bundle.discard([patch_id for patch_id, patch in registry.patches.items()
+                                      if patch['fixture_id'] in affected])
+            self._registry = registry
+            self._standby_cue = None
+            self._patch_list_dirty = True
+            logger.info(translate('MidiFixtureControl', 'Reloaded fixture definitions: %s'),
+                        ', '.join(sorted(affected)))
+
+        self.fixtures_reloaded.emit(affected)
+
+    def update_dca_assignments(self, assignments, dca_count=None):
+        '''Bring the DCA device's channel-to-DCA assignments in line with those given.
+
+        `assignments` is a dict of channel → iterable of DCAs, describing the
+        wanted membership of each listed channel. Unlisted channels are left
+        alone.
 
-            if 'midi_deviceid' in patch and patch['midi_deviceid'] != self.fixtures[patch_id].deviceid:
-                self.fixtures[patch_id].deviceid = patch['midi_deviceid']
+        Only the assignments that differ from what was last sent are sent,
+        as a single ordered burst. See `DcaAssignmentMatrix.diff` for the
+        ordering, and for the meaning of `dca_count`.
+        '''
+        patch_id = self.SessionConfig['dca_device']
+        if not patch_id:
+            logger.warning('No DCA device has been set.')
+            return
 
-            if 'midi_channel' in patch and (self.fixtures[patch_id].channel is None or patch['midi_channel'] < self.fixtures[patch_id].channel):
-                self.fixtures[patch_id].channel = patch['midi_channel']
+        changes = self._dca_matrix.diff(assignments, dca_count)
+        if not changes:
+            return
 
-            if 'midi_channel' in patch:
-                if patch['midi_channel'] > self.fixtures[patch_id].channel:
-                    self.fixtures[patch_id].channel = patch['midi_channel']
-            elif self.fixtures[patch_id].channel is not None:
-                self.fixtures[patch_id].channel = None
+        profile = self._registry.fixture(patch_id)
+        if profile is None:
+            logger.warning('Patch ID "%s" not in prepped fixtures.', {patch_id})
+            return
+
+        missing = {self.DcaAssignCommand, self.DcaUnassignCommand} - set(profile.command_list)
+        if missing:
+            logger.warning('The DCA device (patch "%s") has no %s command; unable to update '
+                           'its DCA assignments.', patch_id, ' or '.join(sorted(missing)))
+            return
+
+        commands = {
+            DcaAssignmentMatrix.ASSIGN: self.DcaAssignCommand,
+            DcaAssignmentMatrix.UNASSIGN: self.DcaUnassignCommand,
+        }
+        # Changes that fail to build are left out; what's sent is recorded in
+        # the matrix as it's dispatched.
+        self.send_commands([
+            (patch_id, commands[action], {'channel': channel, 'dca': dca})
+            for action, channel, dca in changes
+        ])
+
+    @profiled('session_config_altered')
+    def _on_session_config_altered(self, _):
+        registry = self._registry.derive(self.SessionConfig['patches'])
 
-            if 'midi_deviceid' not in patch and self.fixtures[patch_id].deviceid is not None:
-                self.fixtures[patch_id].deviceid = None
+        # Last-sent state of unpatched or re-addressed fixtures no longer applies.
+        old_patches = self._registry.patches
+        self.state_store.forget([patch_id for patch_id, patch in old_patches.items()
+                                 if registry.patches.get(patch_id) != patch])
+
+        # If there's a valid compiled bundle, fixture profiles are only loaded
+        # when something actually needs them. Otherwise, they're all loaded
+        # in the background; anything needing one before then waits for it.
+        if not self._load_bundle():
+            registry.prep_all()
+
+        # Publish the new patch in one go.
+        self._registry = registry
+
+        # Re-arm the standby cue against the new patch.
+        self._standby_cue = None
+        self._patch_list_dirty = True
+
+        # If the DCA device has been changed (or re-addressed) then what it
+        # was last sent no longer tells us anything.
+        dca_device = None
+        for patch in self.SessionConfig['patches']:
+            if patch['patch_id'] == self.SessionConfig['dca_device']:
+                dca_device = patch
+                break
+        if dca_device != self._dca_device:
+            self._dca_matrix.reset()
+            self._dca_device = dict(dca_device) if dca_device else None
@@ -0,0 +1,230 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=no-name-in-module
+from PyQt5.QtCore import Qt, QT_TRANSLATE_NOOP
+from PyQt5.QtWidgets import QCheckBox, QComboBox, QFormLayout, QGroupBox, QLineEdit, QSpinBox, \
+    QVBoxLayout
+
+# pylint: disable=import-error
+from lisp.ui.settings.pages import SettingsPage
+from lisp.ui.ui_utils import translate
+
+from .profiling import DEFAULT_DIRECTORY
+from .traffic_metrics import default_metrics_path
+
+class MidiFixturePreferences(SettingsPage):
+    '''Application-wide (as opposed to per-session) settings of the plugin.'''
+    # pylint: disable=invalid-name
+    Name = QT_TRANSLATE_NOOP('SettingsPageName', 'MIDI Fixture Control')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.setLayout(QVBoxLayout())
+        self.layout().setAlignment(Qt.AlignTop)
+
+        self.profilingGroup = QGroupBox(self)
+        self.profilingGroup.setTitle(translate('MidiFixturePreferences', 'Profiling'))
+        self.profilingGroup.setLayout(QFormLayout())
+        self.layout().addWidget(self.profilingGroup)
+
+        self.profilingEnabled = QCheckBox(self.profilingGroup)
+        self.profilingEnabled.setText(
+            translate('MidiFixturePreferences', 'Profile fixture commands and settings pages'))
+        self.profilingGroup.layout().addRow(self.profilingEnabled)
+
+        self.profilingDirectory = QLineEdit(self.profilingGroup)
+        self.profilingDirectory.setPlaceholderText(DEFAULT_DIRECTORY)
+        self.profilingGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Report directory'), self.profilingDirectory)
+
+        self.profilingKeep = QSpinBox(self.profilingGroup)
+        self.profilingKeep.setRange(1, 10000)
+        self.profilingGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Reports kept'), self.profilingKeep)
+
+        self.libraryGroup = QGroupBox(self)
+        self.libraryGroup.setTitle(translate('MidiFixturePreferences', 'Fixture Library'))
+        self.libraryGroup.setLayout(QFormLayout())
+        self.layout().addWidget(self.libraryGroup)
+
+        self.libraryWatch = QCheckBox(self.libraryGroup)
+        self.libraryWatch.setText(
+            translate('MidiFixturePreferences', 'Reload fixture definitions when they are edited'))
+        self.libraryGroup.layout().addRow(self.libraryWatch)
+
+        self.metricsGroup = QGroupBox(self)
+        self.metricsGroup.setTitle(translate('MidiFixturePreferences', 'Traffic Metrics'))
+        self.metricsGroup.setLayout(QFormLayout())
+        self.layout().addWidget(self.metricsGroup)
+
+        self.metricsEnabled = QCheckBox(self.metricsGroup)
+        self.metricsEnabled.setText(
+            translate('MidiFixturePreferences', 'Periodically write traffic counters to file'))
+        self.metricsGroup.layout().addRow(self.metricsEnabled)
+
+        self.metricsFormat = QComboBox(self.metricsGroup)
+        self.metricsFormat.addItem('JSON', 'json')
+        self.metricsFormat.addItem(translate('MidiFixturePreferences', 'Prometheus textfile'),
+                                   'prometheus')
+        self.metricsFormat.currentIndexChanged.connect(self._update_metrics_placeholder)
+        self.metricsGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Format'), self.metricsFormat)
+
+        self.metricsPath = QLineEdit(self.metricsGroup)
+        self.metricsGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'File'), self.metricsPath)
+
+        self.metricsInterval = QSpinBox(self.metricsGroup)
+        self.metricsInterval.setRange(1, 3600)
+        self.metricsInterval.setSuffix(' s')
+        self.metricsGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Interval'), self.metricsInterval)
+
+        self._update_metrics_placeholder()
+
+        self.coalescingGroup = QGroupBox(self)
+        self.coalescingGroup.setTitle(translate('MidiFixturePreferences', 'Coalescing'))
+        self.coalescingGroup.setLayout(QFormLayout())
+        self.layout().addWidget(self.coalescingGroup)
+
+        self.coalescingWindow = QSpinBox(self.coalescingGroup)
+        self.coalescingWindow.setRange(0, 100)
+        self.coalescingWindow.setSuffix(' ms')
+        self.coalescingWindow.setSpecialValueText(translate('MidiFixturePreferences', 'Off'))
+        self.coalescingWindow.setToolTip(translate(
+            'MidiFixturePreferences',
+            'Commands sent to an output within this time of each other are sent together, '
+            'with any superseded by a later command dropped.'))
+        self.coalescingGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Window'), self.coalescingWindow)
+
+        self.watchdogGroup = QGroupBox(self)
+        self.watchdogGroup.setTitle(translate('MidiFixturePreferences', 'Unresponsive Outputs'))
+        self.watchdogGroup.setLayout(QFormLayout())
+        self.layout().addWidget(self.watchdogGroup)
+
+        self.watchdogDeadline = QSpinBox(self.watchdogGroup)
+        self.watchdogDeadline.setRange(1, 10000)
+        self.watchdogDeadline.setSuffix(' ms')
+        self.watchdogDeadline.setToolTip(translate(
+            'MidiFixturePreferences',
+            'An output taking longer than this to accept a message is considered stalled.'))
+        self.watchdogGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Send deadline'), self.watchdogDeadline)
+
+        self.watchdogMode = QComboBox(self.watchdogGroup)
+        self.watchdogMode.addItem(translate('MidiFixturePreferences', 'Buffer messages'), 'buffer')
+        self.watchdogMode.addItem(translate('MidiFixturePreferences', 'Drop messages'), 'drop')
+        self.watchdogGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Whilst unresponsive'), self.watchdogMode)
+
+        self.watchdogBufferLimit = QSpinBox(self.watchdogGroup)
+        self.watchdogBufferLimit.setRange(1, 100000)
+        self.watchdogBufferLimit.setSuffix(translate('MidiFixturePreferences', ' messages'))
+        self.watchdogGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Buffer limit'), self.watchdogBufferLimit)
+
+        self.watchdogRecovery = QComboBox(self.watchdogGroup)
+        self.watchdogRecovery.addItem(translate('MidiFixturePreferences', 'Send buffered messages'),
+                                      'flush')
+        self.watchdogRecovery.addItem(
+            translate('MidiFixturePreferences', 'Discard buffered messages'), 'discard')
+        self.watchdogGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'On recovery'), self.watchdogRecovery)
+
+        self.resyncOnReconnect = QCheckBox(self.watchdogGroup)
+        self.resyncOnReconnect.setText(
+            translate('MidiFixturePreferences', 'Resend fixture state when an output reconnects'))
+        self.watchdogGroup.layout().addRow(self.resyncOnReconnect)
+
+        self.resyncRate = QSpinBox(self.watchdogGroup)
+        self.resyncRate.setRange(100, 1000000)
+        self.resyncRate.setSuffix(' B/s')
+        self.resyncRate.setToolTip(translate(
+            'MidiFixturePreferences',
+            'How fast fixture state is resent. A standard MIDI cable carries 3125 bytes per second.'))
+        self.watchdogGroup.layout().addRow(
+            translate('MidiFixturePreferences', 'Resend rate'), self.resyncRate)
+
+    def _update_metrics_placeholder(self):
+        self.metricsPath.setPlaceholderText(default_metrics_path(self.metricsFormat.currentData()))
+
+    def getSettings(self):
+        return {
+            'profiling': {
+                'enabled': self.profilingEnabled.isChecked(),
+                'directory': self.profilingDirectory.text(),
+                'keep': self.profilingKeep.value(),
+            },
+            'library': {
+                'watch': self.libraryWatch.isChecked(),
+            },
+            'metrics': {
+                'enabled': self.metricsEnabled.isChecked(),
+                'format': self.metricsFormat.currentData(),
+                'path': self.metricsPath.text(),
+                'interval': self.metricsInterval.value(),
+            },
+            'coalescing': {
+                'window': self.coalescingWindow.value(),
+            },
+            'watchdog': {
+                'deadline': self.watchdogDeadline.value(),
+                'mode': self.watchdogMode.currentData(),
+                'buffer_limit': self.watchdogBufferLimit.value(),
+                'on_recovery': self.watchdogRecovery.currentData(),
+            },
+            'resync': {
+                'on_reconnect': self.resyncOnReconnect.isChecked(),
+                'rate': self.resyncRate.value(),
+            },
+        }
+
+    def loadSettings(self, settings):
+        profiling = settings.get('profiling', {})
+        self.profilingEnabled.setChecked(profiling.get('enabled', False))
+        self.profilingDirectory.setText(profiling.get('directory', ''))
+        self.profilingKeep.setValue(profiling.get('keep', 50))
+
+        self.libraryWatch.setChecked(settings.get('library', {}).get('watch', False))
+
+        metrics = settings.get('metrics', {})
+        self.metricsEnabled.setChecked(metrics.get('enabled', False))
+        self.metricsFormat.setCurrentIndex(
+            max(0, self.metricsFormat.findData(metrics.get('format', 'json'))))
+        self.metricsPath.setText(metrics.get('path', ''))
+        self.metricsInterval.setValue(metrics.get('interval', 10))
+
+        self.coalescingWindow.setValue(settings.get('coalescing', {}).get('window', 0))
+
+        watchdog = settings.get('watchdog', {})
+        self.watchdogDeadline.setValue(watchdog.get('deadline', 500))
+        self.watchdogMode.setCurrentIndex(
+            max(0, self.watchdogMode.findData(watchdog.get('mode', 'buffer'))))
+        self.watchdogBufferLimit.setValue(watchdog.get('buffer_limit', 1024))
+        self.watchdogRecovery.setCurrentIndex(
+            max(0, self.watchdogRecovery.findData(watchdog.get('on_recovery', 'flush'))))
+
+        resync = settings.get('resync', {})
+        self.resyncOnReconnect.setChecked(resync.get('on_reconnect', True))
+        self.resyncRate.setValue(resync.get('rate', 3125))
@@ -20,24 +20,234 @@
 # You should have received a copy of the GNU General Public License
 # along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
 
+from threading import Lock, Thread
+
 # pylint: disable=no-name-in-module
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
 from PyQt5.QtWidgets import QDialog, QGridLayout, QVBoxLayout, QFormLayout, QGroupBox, QComboBox, \
-    QTreeWidget, QTreeWidgetItem, QDialogButtonBox, QHeaderView
-
-from midi_fixture_library import Catalogue
+    QTreeView, QDialogButtonBox, QHeaderView, QLineEdit
 
 # pylint: disable=import-error
 from lisp.ui.ui_utils import translate
 
-class FixtureSelectDialog(QDialog):
+from .fixture_registry import preload_catalogue, shared_catalogue
+from .profiling import profiled
+
+class FixtureCatalogueIndex:
+    '''Precomputed, searchable index of the devices within a fixture Catalogue.
+
+    Everything that the fixture browser filters on is computed once, here, so
+    that changing a filter or typing in the search box never has to go back to
+    the Catalogue.
+
+    Free-text search is served by a trigram index (for search terms of three
+    characters or more) and an index of every shorter run of characters (for
+    shorter terms), so that a term matches anywhere within a word whatever
+    its length (e.g. "32" finds "X32").
+    '''
+
+    SHORT_TERM_LENGTH = 2
+
+    def __init__(self, catalogue):
+        self.manufacturers = catalogue.manufacturers()
+        self.device_types = catalogue.device_types()
+        self.device_subtypes = {}
+
+        self.rows = []
+        self.row_map = {}
+
+        device_list = catalogue.devices(None, None, None)
+        for device_id, device in device_list.items():
+            self.row_map[device_id] = len(self.rows)
+            self.rows.append((
+                device_id,
+                device['manufacturer_name'],
+                device['type'],
+                device['subtype'],
+                device['name'],
+            ))
+
+        self._by_manufacturer = {}
+        for manu_id in self.manufacturers:
+            self._by_manufacturer[manu_id] = self._to_row_set(
+                catalogue.devices(manu_id, None, None))
+
+        self._by_type = {}
+        self._by_subtype = {}
+        for type_id in self.device_types:
+            self._by_type[type_id] = self._to_row_set(catalogue.devices(None, type_id, None))
+            self.device_subtypes[type_id] = catalogue.device_types(type_id)
+            for subtype_id in self.device_subtypes[type_id]:
+                self._by_subtype[(type_id, subtype_id)] = self._to_row_set(
+                    catalogue.devices(None, type_id, subtype_id))
+
+        self._haystacks = [' '.join(row[1:]).lower() for row in self.rows]
+        self._trigrams = {}
+        self._short_terms = {}
+        for row_idx, haystack in enumerate(self._haystacks):
+            for word in haystack.split():
+                for short_term in self._split_short_terms(word):
+                    self._short_terms.setdefault(short_term, set()).add(row_idx)
+                for trigram in self._split_trigrams(word):
+                    self._trigrams.setdefault(trigram, set()).add(row_idx)
+
+    def _to_row_set(self, device_list):
+        return {self.row_map[device_id] for device_id in device_list if device_id in self.row_map}
+
+    @staticmethod
+    def _split_trigrams(word):
+        return {word[idx:idx + 3] for idx in range(len(word) - 2)}
+
+    @classmethod
+    def _split_short_terms(cls, word):
+        return {word[idx:idx + length]
+                for length in range(1, cls.SHORT_TERM_LENGTH + 1)
+                for idx in range(len(word) - length + 1)}
+
+    def filter(self, manufacturer=None, device_type=None, device_subtype=None, text=''):
+        '''Returns the set of row indices matching all given criteria.
+
+        Returns `None` if no criteria were given, meaning that every row matches.
+        '''
+        candidates = None
+
+        def _narrow(current, rows):
+            return set(rows) if current is None else current & rows
+
+        if manufacturer is not None:
+            candidates = _narrow(candidates, self._by_manufacturer.get(manufacturer, set()))
+
+        if device_type is not None:
+            if device_subtype is not None:
+                rows = self._by_subtype.get((device_type, device_subtype), set())
+            else:
+                rows = self._by_type.get(device_type, set())
+            candidates = _narrow(candidates, rows)
+
+        for term in text.lower().split():
+            candidates = _narrow(candidates, self._search_term(term))
+            if not candidates:
+                break
+
+        return candidates
+
+    def _search_term(self, term):
+        if len(term) <= self.SHORT_TERM_LENGTH:
+            return self._short_terms.get(term, set())
+
+        matches = None
+        for trigram in self._split_trigrams(term):
+            rows = self._trigrams.get(trigram, set())
+            matches = set(rows) if matches is None else matches & rows
+            if not matches:
+                return set()
+
+        # Trigrams can match out of order, so confirm with a substring test.
+        return {row_idx for row_idx in matches if term in self._haystacks[row_idx]}
+
+class FixtureCatalogueModel(QAbstractTableModel):
+    # pylint: disable=invalid-name
+    '''Read-only model exposing a FixtureCatalogueIndex to Qt views.'''
+
+    COLUMN_LABELS = ['Manufacturer', 'Type', 'Subtype', 'Model']
+
+    def __init__(self, index, **kwargs):
+        super().__init__(**kwargs)
+        self.catalogue_index = index
+
+    def rowCount(self, parent=QModelIndex()):
+        # pylint: disable=missing-docstring
+        if parent.isValid():
+            return 0
+        return len(self.catalogue_index.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        # pylint: disable=missing-docstring
+        if parent.isValid():
+            return 0
+        return len(self.COLUMN_LABELS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        # pylint: disable=missing-docstring
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMN_LABELS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        # pylint: disable=missing-docstring
+        if not index.isValid():
+            return None
+
+        row = self.catalogue_index.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row[index.column() + 1]
+        if role == Qt.UserRole:
+            return row[0]
+        return None
+
+    def flags(self, index):
+        # pylint: disable=missing-docstring, no-self-use
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+class FixtureFilterProxyModel(QSortFilterProxyModel):
+    # pylint: disable=invalid-name
+    '''Filters a FixtureCatalogueModel using its index, without touching the source rows.'''
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self._accepted_rows = None
+
+    def setCriteria(self, manufacturer=None, device_type=None, device_subtype=None, text=''):
+        '''Set the filter criteria. Any criterion left as `None` (or empty) is ignored.'''
+        self._accepted_rows = self.sourceModel().catalogue_index.filter(
+            manufacturer, device_type, device_subtype, text)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        # pylint: disable=missing-docstring, unused-argument
+        return self._accepted_rows is None or source_row in self._accepted_rows
+
+_SHARED_INDEX = None
+_SHARED_INDEX_LOCK = Lock()
+
+def shared_catalogue_index():
+    '''Returns the process-wide FixtureCatalogueIndex, building it first if necessary.
+
+    If the index is currently being built in the background (see
+    `preload_catalogue_index`), this waits for that to finish rather than
+    building a second copy.
+    '''
+    global _SHARED_INDEX # pylint: disable=global-statement
+    with _SHARED_INDEX_LOCK:
+        if _SHARED_INDEX is None:
+            _SHARED_INDEX = FixtureCatalogueIndex(shared_catalogue(include_unstable=False))
+        return _SHARED_INDEX
+
+def reset_catalogue_index():
+    '''Drop the shared FixtureCatalogueIndex, so it's built afresh when next needed.'''
+    global _SHARED_INDEX # pylint: disable=global-statement
+    with _SHARED_INDEX_LOCK:
+        _SHARED_INDEX = None
+
+def preload_catalogue_index():
+    '''Starts building the shared FixtureCatalogueIndex in a background thread.
+
+    The full catalogue (as used by the patch settings) is loaded alongside.
+    '''
+    preload_catalogue(include_unstable=True)
+    Thread(target=shared_catalogue_index, name='FixtureCatalogueIndexPreload', daemon=True).start()
+
+class FixtureSelectDialog(QDialog):
+
+    @profiled('fixture_select_dialog')
+    def __init__(self, catalogue_index=None, **kwargs):
+        super().__init__(**kwargs)
 
         self.setWindowTitle(translate('MidiFixtureSettings', 'MIDI Fixture Selection'))
         self.setMinimumSize(600, 400)
-        self.catalogue = Catalogue(include_unstable=False)
+        self.catalogue_index = catalogue_index or shared_catalogue_index()
 
         self.setLayout(QGridLayout())
 
@@ -53,7 +263,7 @@ class FixtureSelectDialog(QDialog):
         self.layout().addWidget(self.type_group, 0, 1)
 
         self.type_manufacturer_combo = QComboBox(self)
-        manu_list = self.catalogue.manufacturers()
+        manu_list = self.catalogue_index.manufacturers
         self.type_manufacturer_combo.addItem("(None)", None)
         for manu_id in manu_list:
             self.type_manufacturer_combo.addItem(manu_list[manu_id], manu_id)
@@ -61,7 +271,7 @@ class FixtureSelectDialog(QDialog):
         self.manufacturer_group.layout().addWidget(self.type_manufacturer_combo)
 
         self.maintype_combo = QComboBox(self)
-        type_list = self.catalogue.device_types()
+        type_list = self.catalogue_index.device_types
         self.maintype_combo.addItem("(None)", None)
         for type_id in type_list:
             self.maintype_combo.addItem(type_list[type_id], type_id)
@@ -75,39 +285,43 @@ class FixtureSelectDialog(QDialog):
         self.type_group.layout().addRow(translate('MidiFixtureSettings', 'Sub-Type'),
                                         self.subtype_combo)
 
-        self.fixture_list = QTreeWidget(self)
-        self.fixture_list.setHeaderLabels(["Manufacturer", "Type", "Subtype", "Model"])
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText(translate('MidiFixtureSettings', 'Search...'))
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self._update_list)
+        self.layout().addWidget(self.search_box, 1, 0, 1, 2)
+
+        self.fixture_model = FixtureCatalogueModel(self.catalogue_index, parent=self)
+        self.fixture_proxy = FixtureFilterProxyModel(parent=self)
+        self.fixture_proxy.setSourceModel(self.fixture_model)
+
+        self.fixture_list = QTreeView(self)
+        self.fixture_list.setModel(self.fixture_proxy)
         self.fixture_list.header().setSectionResizeMode(QHeaderView.ResizeToContents)
         self.fixture_list.setIndentation(0)
-        self.layout().addWidget(self.fixture_list, 1, 0, 1, 2)
+        self.fixture_list.setRootIsDecorated(False)
+        self.fixture_list.setUniformRowHeights(True)
+        self.fixture_list.doubleClicked.connect(self.accept)
+        self.layout().addWidget(self.fixture_list, 2, 0, 1, 2)
 
         self.buttons = QDialogButtonBox(self)
         self.buttons.addButton(QDialogButtonBox.Cancel)
         self.buttons.addButton(QDialogButtonBox.Ok)
-        self.layout().addWidget(self.buttons, 2, 0, 1, 2)
+        self.layout().addWidget(self.buttons, 3, 0, 1, 2)
 
         self.buttons.accepted.connect(self.accept)
         self.buttons.rejected.connect(self.reject)
         self._update_list()
 
     def selected_fixture(self):
-        items = self.fixture_list.selectedItems()
-        return items[0].data(0, Qt.UserRole) if items else None
+        indexes = self.fixture_list.selectionModel().selectedRows()
+        return indexes[0].data(Qt.UserRole) if indexes else None
 
     def _update_list(self):
-        self.fixture_list.clear()
-
-        device_list = self.catalogue.devices(self.type_manufacturer_combo.currentData(),
-                                             self.maintype_combo.currentData(),
-                                             self.subtype_combo.currentData())
-        for device_id in device_list:
-            item = QTreeWidgetItem()
-            item.setData(0, Qt.UserRole, device_id)
-            item.setText(0, device_list[device_id]['manufacturer_name'])
-            item.setText(1, device_list[device_id]['type'])
-            item.setText(2, device_list[device_id]['subtype'])
-            item.setText(3, device_list[device_id]['name'])
-            self.fixture_list.addTopLevelItem(item)
+        self.fixture_proxy.setCriteria(self.type_manufacturer_combo.currentData(),
+                                       self.maintype_combo.currentData(),
+                                       self.subtype_combo.currentData(),
+                                       self.search_box.text())
 
     def _select_type(self):
         selected_type = self.maintype_combo.currentData()
@@ -120,7 +334,7 @@ class FixtureSelectDialog(QDialog):
 
         # populate
         if selected_type:
-            subtype_list = self.catalogue.device_types(selected_type)
+            subtype_list = self.catalogue_index.device_subtypes[selected_type]
             for subtype_id in subtype_list:
                 self.subtype_combo.addItem(subtype_list[subtype_id], subtype_id)
             self.subtype_combo.currentIndexChanged.connect(self._update_list)
@@ -20,15 +20,12 @@
 # You should have received a copy of the GNU General Public License
 # along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
 
-from copy import copy
 import logging
 
 # pylint: disable=no-name-in-module
 from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
 from PyQt5.QtWidgets import QGridLayout, QGroupBox, QPushButton, QVBoxLayout
 
-from midi_fixture_library import Catalogue
-
 # pylint: disable=import-error
 from lisp.plugins import get_plugin
 from lisp.core.plugin import PluginNotLoadedError
@@ -37,7 +34,20 @@ from lisp.ui.qdelegates import SpinBoxDelegate
 from lisp.ui.settings.pages import SettingsPage
 from lisp.ui.ui_utils import translate
 
-from .midi_fixture_select import FixtureSelectDialog
+from .address_space import MidiChannelAddressSpace, MidiDeviceIdAddressSpace
+from .fixture_registry import shared_catalogue
+from .midi_fixture_select import FixtureSelectDialog, preload_catalogue_index
+from .patch_schema import (
+    CHANNEL_COUNT,
+    DCA_CAPABLE,
+    DEVICEID_COUNT,
+    PATCH_SCHEMA_VERSION,
+    flags_as_profile,
+    profile_flags,
+    upgrade,
+    validate,
+)
+from .profiling import profiled
 from .ui import LabelDelegate, MIDIPatchComboDelegate, RadioButtonDelegate, RadioButtonHidableDelegate, SimpleTableView
 
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
@@ -71,6 +81,7 @@ class MidiFixtureSettings(SettingsPage):
         }
     ]
 
+    @profiled('patch_settings_page')
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.setLayout(QVBoxLayout())
@@ -82,7 +93,11 @@ class MidiFixtureSettings(SettingsPage):
         except PluginNotLoadedError:
             self.TABLE_COLUMNS[8] = None
 
-        self.fixtureSelectDialog = FixtureSelectDialog(parent=self)
+        # Created on first use. The catalogue data behind it is shared, and
+        # only loaded once the patch settings are first opened: sessions run
+        # from a compiled bundle need never load it at all.
+        self.fixtureSelectDialog = None
+        preload_catalogue_index()
 
         self.patchGroup = QGroupBox(self)
         self.patchGroup.setTitle("MIDI Fixture Patch")
@@ -115,6 +130,9 @@ class MidiFixtureSettings(SettingsPage):
         self.patchListModel.removePatch(self.patchListView.selectedIndexes()[0].row())
 
     def selectFixture(self):
+        if self.fixtureSelectDialog is None:
+            self.fixtureSelectDialog = FixtureSelectDialog(parent=self)
+
         if self.fixtureSelectDialog.exec_() == self.fixtureSelectDialog.Accepted:
             selected = self.fixtureSelectDialog.selected_fixture()
             if selected:
@@ -143,8 +161,15 @@ class MidiPatchModel(QAbstractTableModel):
             self.channel_address_spaces[midi_patch_id] = MidiChannelAddressSpace()
             self.deviceid_address_spaces[midi_patch_id] = MidiDeviceIdAddressSpace()
 
-        self.catalogue = Catalogue(include_unstable=True)
+        # Only needed when fixtures are added or changed, or older sessions loaded.
+        self._catalogue = None
+        self._descriptions = {}
         self.patch_count = 0
+        # Patches that couldn't be placed where they were patched, when loaded.
+        # They occupy nothing in the address spaces until they can be.
+        self.conflicts = []
+        self._conflicting = set()
+        get_plugin('MidiFixtureControl').fixtures_reloaded.connect(self._fixturesReloaded)
         self.rows = []
         self.columns = [
             {
@@ -195,6 +220,101 @@ class MidiPatchModel(QAbstractTableModel):
             }
         ]
         self.column_map = {col_spec['id']: col_idx for col_idx, col_spec in enumerate(self.columns)}
+        # Each row also holds the fixture's width and flags (see `patch_schema`),
+        # after (and not shown in) its columns.
+        self.width_field = len(self.columns)
+        self.flags_field = len(self.columns) + 1
+
+    @property
+    def catalogue(self):
+        if self._catalogue is None:
+            self._catalogue = shared_catalogue(include_unstable=True)
+        return self._catalogue
+
+    def _describe(self, fixture_id):
+        '''Returns the catalogue description of a fixture.'''
+        if fixture_id not in self._descriptions:
+            self._descriptions[fixture_id] = self.catalogue.device_description(fixture_id)
+        return self._descriptions[fixture_id]
+
+    def _fixturesReloaded(self, fixture_ids):
+        '''Re-resolve the width and flags of rows whose fixture definitions have been reloaded.'''
+        self._catalogue = None
+        for fixture_id in fixture_ids:
+            self._descriptions.pop(fixture_id, None)
+
+        changed = False
+        for row in self.rows:
+            fixture_id = row[self.column_map['fixture_id']]
+            if fixture_id not in fixture_ids:
+                continue
+            description = self._describe(fixture_id)
+            width, flags = description['width'], profile_flags(description)
+            if (width, flags) != (row[self.width_field], row[self.flags_field]):
+                row[self.width_field] = width
+                row[self.flags_field] = flags
+                changed = True
+
+        if not changed:
+            return
+
+        # A fixture may now be wider (or narrower) than it was: re-check the patch.
+        channels, deviceids, self.conflicts = validate(self.serialise()['patches'])
+        self._conflicting = {conflict.patch_id for conflict in self.conflicts}
+        for midi_patch_id, used in channels.items():
+            self.channel_address_spaces.setdefault(midi_patch_id, MidiChannelAddressSpace()).occupy(used)
+        for midi_patch_id, used in deviceids.items():
+            self.deviceid_address_spaces.setdefault(midi_patch_id, MidiDeviceIdAddressSpace()).occupy(used)
+        self.dataChanged.emit(self.index(0, 0),
+                              self.index(self.rowCount() - 1, self.columnCount() - 1))
+
+    def _isConflicting(self, row):
+        return self.rows[row][self.column_map['patch_id']] in self._conflicting
+
+    def _placeConflicting(self, row, midi_patch_id, address=None, deviceid=None):
+        '''Tries to place a conflicting row's fixture in the address spaces of an output.
+
+        It's placed at the given address and device id (else its current ones)
+        or the nearest free after. Returns whether it could be placed; if not,
+        it remains in conflict, occupying nothing.
+        '''
+        fixture_profile = self._rowProfile(row)
+        width = fixture_profile['width']
+        channel_space = self.channel_address_spaces[midi_patch_id]
+        deviceid_space = self.deviceid_address_spaces[midi_patch_id]
+
+        if fixture_profile['requiresMidiChannel']:
+            if address is None:
+                address = self.data(self.getIndex(row, 'address'), Qt.EditRole)
+            address = channel_space.find(min(max(address, 1), CHANNEL_COUNT - width + 1), width)
+            if address == -1:
+                return False
+
+        if fixture_profile['requiresMidiDeviceID']:
+            if deviceid is None:
+                deviceid = self.data(self.getIndex(row, 'midi_device_id'), Qt.EditRole)
+            deviceid = deviceid_space.find(min(max(deviceid, 1), DEVICEID_COUNT))
+            if deviceid == -1:
+                return False
+
+        if fixture_profile['requiresMidiChannel']:
+            channel_space.add(address, width)
+            self.setData(self.getIndex(row, 'address'), address, disable_custom_setter=True)
+        if fixture_profile['requiresMidiDeviceID']:
+            deviceid_space.add(deviceid)
+            self.setData(self.getIndex(row, 'midi_device_id'), deviceid, disable_custom_setter=True)
+
+        self._resolveConflict(row)
+        return True
+
+    def _resolveConflict(self, row):
+        patch_id = self.rows[row][self.column_map['patch_id']]
+        self._conflicting.discard(patch_id)
+        self.conflicts = [conflict for conflict in self.conflicts if conflict.patch_id != patch_id]
+
+    def _rowProfile(self, row):
+        '''Returns the width and requirements of the fixture in a row, without a catalogue lookup.'''
+        return flags_as_profile(self.rows[row][self.width_field], self.rows[row][self.flags_field])
 
     def rowCount(self, parent=None):
         # pylint: disable=invalid-name, missing-docstring, unused-argument
@@ -237,8 +357,7 @@ class MidiPatchModel(QAbstractTableModel):
         return self.createIndex(row, self.column_map[col_id])
 
     def _getMidiAddressEnd(self, row):
-        fixture_id = self.data(self.getIndex(row, 'fixture_id'))
-        fixture_profile = self.catalogue.device_description(fixture_id)
+        fixture_profile = self._rowProfile(row)
 
         if not fixture_profile['requiresMidiChannel']:
             return '-'
@@ -248,7 +367,7 @@ class MidiPatchModel(QAbstractTableModel):
 
     def _getFixtureLabel(self, row):
         fixture_id = self.data(self.getIndex(row, 'fixture_id'))
-        fixture_profile = self.catalogue.device_description(fixture_id)
+        fixture_profile = self._describe(fixture_id)
 
         return '{manu} {model}'.format_map({
             'manu': fixture_profile['manufacturer_name'],
@@ -290,7 +409,7 @@ class MidiPatchModel(QAbstractTableModel):
         return False
 
     def appendPatch(self, fixture_id):
-        fixture_profile = self.catalogue.device_description(fixture_id)
+        fixture_profile = self._describe(fixture_id)
         midi_patch_id = list(self.channel_address_spaces.keys())[0]
 
         fixture_address = -1
@@ -322,7 +441,9 @@ class MidiPatchModel(QAbstractTableModel):
                           fixture_deviceid,
                           None,
                           self.rowCount() == 0,
-                          -1 if not fixture_profile['dcaCapable'] else set_dca])
+                          -1 if not fixture_profile['dcaCapable'] else set_dca,
+                          fixture_profile['width'],
+                          profile_flags(fixture_profile)])
         self.endInsertRows()
         self.patch_count += 1
 
@@ -331,9 +452,16 @@ class MidiPatchModel(QAbstractTableModel):
             return
 
         midi_patch_id = self.data(self.getIndex(row, 'midi_patch_id'), Qt.EditRole)
-        old_id = self.data(self.getIndex(row, 'fixture_id'))
-        old_profile = self.catalogue.device_description(old_id)
-        new_profile = self.catalogue.device_description(new_id)
+        old_profile = self._rowProfile(row)
+        new_profile = self._describe(new_id)
+
+        # A fixture in conflict occupies nothing, so has nothing to move: it's
+        # changed in place, then placed afresh (if it can be).
+        if self._isConflicting(row):
+            self._amendConflicting(row, old_profile, new_profile)
+            self.setData(self.getIndex(row, 'fixture_id'), new_id)
+            self._placeConflicting(row, midi_patch_id)
+            return
 
         ### MIDI Channel Addresses (part 1):
         # Get the width of the old profile, and the old address:
@@ -391,6 +519,29 @@ class MidiPatchModel(QAbstractTableModel):
         else:
             self.setData(self.getIndex(row, 'address'), -1, disable_custom_setter=True)
 
+        self._amendDca(row, old_profile, new_profile)
+
+        ### And finally the Fixture ID (which identifies the device to the Fixture Library)
+        self.rows[row][self.width_field] = new_profile['width']
+        self.rows[row][self.flags_field] = profile_flags(new_profile)
+        self.setData(self.getIndex(row, 'fixture_id'), new_id)
+
+    def _amendConflicting(self, row, old_profile, new_profile):
+        if not new_profile['requiresMidiChannel']:
+            self.setData(self.getIndex(row, 'address'), -1, disable_custom_setter=True)
+        elif not old_profile['requiresMidiChannel']:
+            self.setData(self.getIndex(row, 'address'), 1, disable_custom_setter=True)
+
+        if not new_profile['requiresMidiDeviceID']:
+            self.setData(self.getIndex(row, 'midi_device_id'), -1, disable_custom_setter=True)
+        elif not old_profile['requiresMidiDeviceID']:
+            self.setData(self.getIndex(row, 'midi_device_id'), 1, disable_custom_setter=True)
+
+        self._amendDca(row, old_profile, new_profile)
+        self.rows[row][self.width_field] = new_profile['width']
+        self.rows[row][self.flags_field] = profile_flags(new_profile)
+
+    def _amendDca(self, row, old_profile, new_profile):
         ### DCA Assigns
         if old_profile['dcaCapable'] != new_profile['dcaCapable']:
             if new_profile['dcaCapable']:
@@ -411,22 +562,22 @@ class MidiPatchModel(QAbstractTableModel):
                          set_dca if new_profile['dcaCapable'] else -1,
                          role=Qt.EditRole)
 
-        ### And finally the Fixture ID (which identifies the device to the Fixture Library)
-        self.setData(self.getIndex(row, 'fixture_id'), new_id)
-
     def removePatch(self, row):
         if row == -1 or row >= self.rowCount():
             return
 
         midi_patch_id = self.data(self.getIndex(row, 'midi_patch_id'), Qt.EditRole)
-        fixture_id = self.data(self.getIndex(row, 'fixture_id'))
-        fixture_profile = self.catalogue.device_description(fixture_id)
+        fixture_profile = self._rowProfile(row)
 
-        if fixture_profile['requiresMidiChannel']:
+        # A fixture in conflict occupies nothing, so there's nothing to free.
+        placed = not self._isConflicting(row)
+        self._resolveConflict(row)
+
+        if placed and fixture_profile['requiresMidiChannel']:
             self.channel_address_spaces[midi_patch_id].remove(self.data(self.getIndex(row, 'address')),
                                                               fixture_profile['width'])
 
-        if fixture_profile['requiresMidiDeviceID']:
+        if placed and fixture_profile['requiresMidiDeviceID']:
             self.deviceid_address_spaces[midi_patch_id].remove(self.data(self.getIndex(row, 'midi_device_id')))
 
         # Check if default device or chosen dca
@@ -464,9 +615,11 @@ class MidiPatchModel(QAbstractTableModel):
                 'midi_patch_id': row[self.column_map['midi_patch_id']],
                 'patch_id': row[self.column_map['patch_id']],
                 'fixture_id': row[self.column_map['fixture_id']],
+                'width': row[self.width_field],
+                'flags': row[self.flags_field],
             }
 
-            fixture_profile = self.catalogue.device_description(row[self.column_map['fixture_id']])
+            fixture_profile = flags_as_profile(row[self.width_field], row[self.flags_field])
             if fixture_profile['requiresMidiChannel']:
                 new_patch['midi_channel'] = row[self.column_map['address']] - 1
             if fixture_profile['requiresMidiDeviceID']:
@@ -483,9 +636,11 @@ class MidiPatchModel(QAbstractTableModel):
             'patches': patches,
             'default_patch': default_patch,
             'dca_device': dca_device,
-            'patch_count': self.patch_count
+            'patch_count': self.patch_count,
+            'patch_schema': PATCH_SCHEMA_VERSION,
         }
 
+    @profiled('patch_deserialise')
     def deserialise(self, config):
         '''De-serialises from a configuration object, restoring the saved patches.'''
         if self.rowCount():
@@ -493,29 +648,43 @@ class MidiPatchModel(QAbstractTableModel):
             return
 
         self.patch_count = config['patch_count']
-        self.beginInsertRows(QModelIndex(), -1, -1)
-        for patch in config['patches']:
-            if 'midi_patch_id' in patch:
-                midi_patch_id = patch['midi_patch_id']
-            else:
-                midi_patch_id = list(self.channel_address_spaces.keys())[0]
-            fixture_profile = self.catalogue.device_description(patch['fixture_id'])
-            self.rows.append([patch['patch_id'],
-                              patch['fixture_id'],
-                              midi_patch_id,
-                              patch['midi_channel'] + 1 if 'midi_channel' in patch else -1,
-                              None,
-                              patch['midi_deviceid'] if 'midi_deviceid' in patch else -1,
-                              None,
-                              patch['patch_id'] == config['default_patch'],
-                              -1 if not fixture_profile['dcaCapable'] else patch['patch_id'] == config['dca_device']]) # pylint: disable=line-too-long
-
-            if fixture_profile['requiresMidiChannel']:
-                self.channel_address_spaces[midi_patch_id].add(patch['midi_channel'] + 1, fixture_profile['width'])
-            if fixture_profile['requiresMidiDeviceID']:
-                self.deviceid_address_spaces[midi_patch_id].add(patch['midi_deviceid'])
-
-        self.endInsertRows()
+        default_output = next(iter(self.channel_address_spaces), None)
+        patches = [patch if 'midi_patch_id' in patch else dict(patch, midi_patch_id=default_output)
+                   for patch in upgrade(config, self._describe)]
+
+        # Validate the whole patch in one go, then fill the address spaces from the result.
+        # Those in conflict are still listed (so they're not lost from the
+        # session), but occupy nothing until they're moved somewhere free.
+        channels, deviceids, self.conflicts = validate(patches)
+        self._conflicting = {conflict.patch_id for conflict in self.conflicts}
+        for midi_patch_id, used in channels.items():
+            if midi_patch_id not in self.channel_address_spaces:
+                self.channel_address_spaces[midi_patch_id] = MidiChannelAddressSpace()
+            self.channel_address_spaces[midi_patch_id].occupy(used)
+        for midi_patch_id, used in deviceids.items():
+            if midi_patch_id not in self.deviceid_address_spaces:
+                self.deviceid_address_spaces[midi_patch_id] = MidiDeviceIdAddressSpace()
+            self.deviceid_address_spaces[midi_patch_id].occupy(used)
+
+        rows = []
+        for patch in patches:
+            dca_capable = patch['flags'] & DCA_CAPABLE
+            rows.append([patch['patch_id'],
+                         patch['fixture_id'],
+                         patch['midi_patch_id'],
+                         patch['midi_channel'] + 1 if 'midi_channel' in patch else -1,
+                         None,
+                         patch['midi_deviceid'] if 'midi_deviceid' in patch else -1,
+                         None,
+                         patch['patch_id'] == config['default_patch'],
+                         patch['patch_id'] == config['dca_device'] if dca_capable else -1,
+                         patch['width'],
+                         patch['flags']])
+
+        if rows:
+            self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+            self.rows = rows
+            self.endInsertRows()
 
     def _updateMidiAddress(self, row, value):
         '''Validates and updates a user-input MIDI Address'''
@@ -523,9 +692,12 @@ class MidiPatchModel(QAbstractTableModel):
         new_address = value
 
         midi_patch_id = self.data(self.getIndex(row, 'midi_patch_id'), Qt.EditRole)
-        fixture_id = self.data(self.getIndex(row, 'fixture_id'))
-        fixture_profile = self.catalogue.device_description(fixture_id)
-        fixture_width = fixture_profile['width']
+        if self._isConflicting(row):
+            if self._placeConflicting(row, midi_patch_id, address=value):
+                return self.data(self.getIndex(row, 'address'), Qt.EditRole)
+            return old_address
+
+        fixture_width = self.rows[row][self.width_field]
 
         new_address = self.channel_address_spaces[midi_patch_id].find(new_address,
                                                                       fixture_width,
@@ -541,6 +713,11 @@ class MidiPatchModel(QAbstractTableModel):
         '''Validates and updates a user-input MIDI Address'''
         midi_patch_id = self.data(self.getIndex(row, 'midi_patch_id'), Qt.EditRole)
         old_address = self.data(self.getIndex(row, 'midi_device_id'))
+        if self._isConflicting(row):
+            if self._placeConflicting(row, midi_patch_id, deviceid=value):
+                return self.data(self.getIndex(row, 'midi_device_id'), Qt.EditRole)
+            return old_address
+
         new_address = self.deviceid_address_spaces[midi_patch_id].find(value, previous=old_address)
 
         if new_address == -1:
@@ -556,8 +733,13 @@ class MidiPatchModel(QAbstractTableModel):
         if old_patch_id == new_patch_id:
             return old_patch_id
 
-        fixture_id = self.data(self.getIndex(row, 'fixture_id'))
-        fixture_profile = self.catalogue.device_description(fixture_id)
+        # A fixture in conflict may be moved freely; it's placed on its new
+        # output if there's room for it there.
+        if self._isConflicting(row):
+            self._placeConflicting(row, new_patch_id)
+            return new_patch_id
+
+        fixture_profile = self._rowProfile(row)
 
         if fixture_profile['requiresMidiChannel']:
             current_address = self.data(self.getIndex(row, 'address'))
@@ -588,135 +770,3 @@ class MidiPatchModel(QAbstractTableModel):
                 self.setData(self.getIndex(row, 'address'), new_address, disable_custom_setter=True)
 
         return new_patch_id
-
-class AddressSpace:
-    '''
-
-    '''
-    def __init__(self, upper_limit):
-        self._upper_limit = upper_limit
-        self.address_space = [False for i in range(self._upper_limit)]
-
-    def _validate(self, start, width):
-        if 1 > start > self._upper_limit:
-            logger.error('Address outside of acceptable limits')
-            return False
-
-        if 1 > width > self._upper_limit:
-            logger.error('Device width outside of acceptable limits')
-            return False
-
-        if start + width - 1 > self._upper_limit:
-            logger.error('Device too wide to fit at this address')
-            return False
-
-        return True
-
-    def fill(self, start, width):
-        '''Fill a block in the address space'''
-        if not self._validate(start, width):
-            return False
-
-        start -= 1
-        working_space = copy(self.address_space)
-
-        for idx in range(start, start + width):
-            if working_space[idx]:
-                logger.error('A device is already assigned at this address')
-                return False
-            working_space[idx] = True
-
-        self.address_space = working_space
-        return True
-
-    def empty(self, start, width):
-        '''Empty a block in the address space'''
-        if not self._validate(start, width):
-            return False
-
-        start -= 1
-        working_space = copy(self.address_space)
-
-        for idx in range(start, start + width):
-            if not working_space[idx]:
-                logger.error('There is no device currently assigned at this address')
-                return False
-            working_space[idx] = False
-
-        self.address_space = working_space
-        return True
-
-    def locate(self, start, width, previous=None):
-        '''locate an appropriately sized empty block in the address space.
-
-        Set `previous` if this is to replace an already existing block.
-        '''
-        if not self._validate(start, width):
-            return -1
-
-        start -= 1
-        working_space = copy(self.address_space)
-
-        if previous is not None:
-            if not self._validate(previous[0], previous[1]):
-                return -1
-            prev_start = previous[0] - 1
-            for idx in range(prev_start, prev_start + previous[1]):
-                if not working_space[idx]:
-                    logger.error('There is no device currently assigned at the previous address')
-                    return -1
-                working_space[idx] = False
-
-        def _check_width(idx):
-            for idx2 in range(width):
-                if idx + idx2 > self._upper_limit - 1 or working_space[idx + idx2]:
-                    return False
-            return True
-
-        for idx in range(start, len(self.address_space)):
-            if not working_space[idx] and _check_width(idx):
-                return idx + 1
-
-        if start != 0:
-            return self.locate(1, width, previous)
-        return -1
-
-class MidiChannelAddressSpace(AddressSpace):
-    '''
-    MIDI Channels 1-16 (NOT 0-15)
-    '''
-    def __init__(self):
-        super().__init__(16)
-
-    def add(self, address, width):
-        '''Add a fixture into the address space.'''
-        return self.fill(address, width)
-
-    def remove(self, address, width):
-        '''Removes a fixture from the address space.'''
-        return self.empty(address, width)
-
-    def find(self, address, width, previous=None):
-        '''Find space wide enough for a fixture.'''
-        return self.locate(address, width, previous)
-
-class MidiDeviceIdAddressSpace(AddressSpace):
-    '''
-    MIDI Device ID 0-111
-    '''
-    def __init__(self):
-        super().__init__(111)
-
-    def add(self, address):
-        '''Add a fixture into the address space.'''
-        return self.fill(address, 1)
-
-    def remove(self, address):
-        '''Removes a fixture from the address space.'''
-        return self.empty(address, 1)
-
-    def find(self, address, previous=None):
-        '''Find an empty slot for a fixture.'''
-        if previous is not None:
-            return self.locate(address, 1, previous=[previous, 1])
-        return self.locate(address, 1)
@@ -0,0 +1,132 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=no-name-in-module
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QGroupBox, QHeaderView, QTableWidget, \
+    QTableWidgetItem, QVBoxLayout
+
+# pylint: disable=import-error
+from lisp.plugins import get_plugin
+from lisp.ui.ui_utils import translate
+
+from .output_watchdog import OutputState
+
+class TrafficStatusDialog(QDialog):
+    '''Shows the plugin's traffic counters, per MIDI output and per patched fixture.'''
+
+    COLUMNS = [
+        ('messages', 'Messages'),
+        ('bytes', 'Bytes'),
+        ('errors', 'Errors'),
+        ('dropped', 'Dropped'),
+        ('queue_depth', 'Queued'),
+        ('largest_burst', 'Largest Burst'),
+    ]
+
+    def __init__(self, plugin, **kwargs):
+        super().__init__(**kwargs)
+        self._plugin = plugin
+        self._midi = get_plugin('Midi')
+
+        self.setWindowTitle(translate('MidiFixtureStatus', 'MIDI Fixture Traffic'))
+        self.setMinimumSize(600, 400)
+        self.setLayout(QVBoxLayout())
+
+        self.outputGroup = QGroupBox(self)
+        self.outputGroup.setTitle(translate('MidiFixtureStatus', 'MIDI Outputs'))
+        self.outputGroup.setLayout(QVBoxLayout())
+        self.outputTable = self._create_table(self.outputGroup, 'Output')
+        self.layout().addWidget(self.outputGroup)
+
+        self.fixtureGroup = QGroupBox(self)
+        self.fixtureGroup.setTitle(translate('MidiFixtureStatus', 'Fixtures'))
+        self.fixtureGroup.setLayout(QVBoxLayout())
+        self.fixtureTable = self._create_table(self.fixtureGroup, 'Patch')
+        self.layout().addWidget(self.fixtureGroup)
+
+        self.buttons = QDialogButtonBox(self)
+        self.buttons.addButton(QDialogButtonBox.Reset)
+        self.buttons.addButton(QDialogButtonBox.Close)
+        self.buttons.button(QDialogButtonBox.Reset).clicked.connect(self._reset)
+        self.buttons.rejected.connect(self.close)
+        self.layout().addWidget(self.buttons)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(1000)
+        self._timer.timeout.connect(self.refresh)
+
+    def _create_table(self, group, key_label):
+        table = QTableWidget(group)
+        table.setColumnCount(len(self.COLUMNS) + 1)
+        table.setHorizontalHeaderLabels(
+            [translate('MidiFixtureStatus', key_label)] +
+            [translate('MidiFixtureStatus', label) for _, label in self.COLUMNS])
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        group.layout().addWidget(table)
+        return table
+
+    def _fill_table(self, table, counters, caption):
+        table.setRowCount(len(counters))
+        for row, key in enumerate(sorted(counters)):
+            table.setItem(row, 0, QTableWidgetItem(caption(key)))
+            for col, (field, _) in enumerate(self.COLUMNS, 1):
+                item = QTableWidgetItem(str(counters[key][field]))
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(row, col, item)
+
+    def _output_caption(self, midi_patch_id):
+        caption = self._midi.output_name_formatted(midi_patch_id)
+        state = self._plugin.output_state(midi_patch_id)
+        if state is not OutputState.Healthy:
+            caption = '{0} [{1}]'.format(caption, translate('MidiFixtureStatus', state.value))
+        return caption
+
+    def _fixture_caption(self, patch_id):
+        patch = self._plugin.SessionConfig.get('patches')
+        for definition in patch:
+            if definition['patch_id'] == patch_id:
+                return '{0} ({1})'.format(patch_id, definition['fixture_id'])
+        return patch_id
+
+    def refresh(self):
+        snapshot = self._plugin.metrics.snapshot()
+        self._fill_table(self.outputTable, snapshot['outputs'], self._output_caption)
+        self._fill_table(self.fixtureTable, snapshot['fixtures'], self._fixture_caption)
+
+    def _reset(self):
+        self._plugin.metrics.reset()
+        self.refresh()
+
+    def showEvent(self, event):
+        # pylint: disable=invalid-name
+        self.refresh()
+        self._timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        # pylint: disable=invalid-name
+        self._timer.stop()
+        super().hideEvent(event)
@@ -0,0 +1,165 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+from threading import Lock, Timer
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# The fields that identify what a message addresses (as opposed to the value it sets).
+#
+# Program changes, channel aftertouch and pitch bends are absent: they carry
+# nothing but a value, so a later one can't be told to set the same parameter.
+ADDRESS_FIELDS = {
+    'control_change': ('channel', 'control'),
+    'note_on': ('channel', 'note'),
+    'note_off': ('channel', 'note'),
+    'polytouch': ('channel', 'note'),
+}
+
+# Controllers that step a parameter rather than set it (Data Increment and
+# Decrement): each one sent counts, so they're never coalesced.
+RELATIVE_CONTROLS = frozenset((96, 97))
+
+# Controllers whose values select the parameter that following Data Entry
+# controllers set (NRPN: 99 & 98, RPN: 101 & 100), and so are part of the address.
+PARAMETER_CONTROLS = frozenset((98, 99, 100, 101))
+
+def message_address(message):
+    '''Returns what a message addresses, or `None` if that can't be told apart from its value.'''
+    fields = ADDRESS_FIELDS.get(message.type)
+    if fields is None:
+        return None
+    if message.type == 'control_change' and message.control in RELATIVE_CONTROLS:
+        return None
+    address = (message.type,) + tuple(getattr(message, field) for field in fields)
+    if message.type == 'control_change' and message.control in PARAMETER_CONTROLS:
+        address += (message.value,)
+    return address
+
+def block_address(patch_id, messages):
+    '''Returns what a command's block of messages addresses, or `None` if unknown.
+
+    Two blocks with the same address set the same parameter(s) of the same
+    fixture, differing at most in value; the later supersedes the earlier.
+    '''
+    addresses = [message_address(message) for message in messages]
+    if not addresses or None in addresses:
+        return None
+    return (patch_id,) + tuple(addresses)
+
+def coalesce(blocks):
+    '''Merges `(patch_id, messages)` blocks, dropping any superseded by a later block.
+
+    A block is superseded by a later one with the same address but a
+    different value. Identical repeats are all kept: a block sent again
+    as-is is more likely a trigger or toggle (e.g. a note used to fire an
+    effect) than a value being set, and each send of it counts.
+
+    Returns the merged messages and their sources (see `CommandMessages`).
+    '''
+    def content(messages):
+        return tuple(tuple(message.bytes()) for message in messages)
+
+    last_of = {}
+    for patch_id, messages in blocks:
+        address = block_address(patch_id, messages)
+        if address is not None:
+            last_of[address] = content(messages)
+
+    merged = []
+    sources = []
+    for patch_id, messages in blocks:
+        address = block_address(patch_id, messages)
+        if address is not None and last_of[address] != content(messages):
+            continue
+        merged.extend(messages)
+        sources.append((patch_id, len(messages)))
+    return merged, sources
+
+class OutputCoalescer:
+    '''Gathers what is sent to an output within a short window, then sends it as one burst.
+
+    Sends to outputs with a window of 0 pass straight through.
+    '''
+
+    def __init__(self, send):
+        '''`send` is called with `(midi_patch_id, messages, sources)`.'''
+        self._send = send
+        self._lock = Lock()
+        self._pending = {}
+        self._timers = {}
+        self.default_window = 0
+        self.windows = {}
+
+    def configure(self, default_window=0, windows=None):
+        '''Set the coalescing windows (in milliseconds): a default, plus per-output overrides.'''
+        self.default_window = default_window
+        self.windows = dict(windows or {})
+
+    def window(self, midi_patch_id):
+        return self.windows.get(midi_patch_id, self.default_window)
+
+    def submit(self, midi_patch_id, messages, sources=None):
+        window = self.window(midi_patch_id)
+        if window <= 0:
+            self._send(midi_patch_id, messages, sources)
+            return
+
+        if sources is None:
+            sources = [(None, len(messages))]
+
+        blocks = []
+        offset = 0
+        for patch_id, message_count in sources:
+            blocks.append((patch_id, messages[offset:offset + message_count]))
+            offset += message_count
+
+        with self._lock:
+            self._pending.setdefault(midi_patch_id, []).extend(blocks)
+            if midi_patch_id not in self._timers:
+                timer = Timer(window / 1000, self.flush, (midi_patch_id,))
+                timer.daemon = True
+                self._timers[midi_patch_id] = timer
+                timer.start()
+
+    def flush(self, midi_patch_id):
+        '''Send everything gathered for an output now.'''
+        with self._lock:
+            timer = self._timers.pop(midi_patch_id, None)
+            blocks = self._pending.pop(midi_patch_id, [])
+        if timer is not None:
+            timer.cancel()
+        if not blocks:
+            return
+
+        messages, sources = coalesce(blocks)
+        try:
+            self._send(midi_patch_id, messages, sources)
+        except Exception: # pylint: disable=broad-except
+            logger.exception('Coalesced send to %s failed', midi_patch_id)
+
+    def flush_all(self):
+        with self._lock:
+            midi_patch_ids = list(self._pending)
+        for midi_patch_id in midi_patch_ids:
+            self.flush(midi_patch_id)
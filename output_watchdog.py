@@ -0,0 +1,257 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque
+from enum import Enum
+import logging
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+class OutputState(Enum):
+    Healthy = 'healthy'
+    # A send has been in progress for longer than the deadline.
+    Stalled = 'stalled'
+    # A send has failed; the output (or its interface) has probably gone.
+    Disconnected = 'disconnected'
+
+class OutputPolicy:
+    '''How an output behaves while (and after being) unhealthy.'''
+    # pylint: disable=too-few-public-methods
+
+    # While unhealthy: 'buffer' what's submitted (up to `buffer_limit`
+    # messages, dropping the oldest) or 'drop' it.
+    mode = 'buffer'
+    buffer_limit = 1024
+
+    # On recovery: 'flush' what was buffered, or 'discard' it.
+    on_recovery = 'flush'
+
+    # A send taking longer than this (seconds) marks the output as stalled.
+    deadline = 0.5
+
+    # How long (seconds) to wait before trying a disconnected output again.
+    retry_interval = 2.0
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+class OutputWorker:
+    '''Sends to one MIDI output from its own thread, so a blocked output can't hold up others.
+
+    Submitted bursts are queued (in a bounded queue) and sent in order. The
+    worker tracks how long each send takes; an `OutputWatchdog` checks these
+    against the deadline, marking the worker stalled if necessary.
+    '''
+
+    def __init__(self, midi_patch_id, send, metrics, policy, on_sent=None, on_state_changed=None):
+        self.midi_patch_id = midi_patch_id
+        self._send = send
+        self._metrics = metrics
+        self.policy = policy
+        self._callbacks = {'sent': on_sent, 'state_changed': on_state_changed}
+
+        self.state = OutputState.Healthy
+        self._queue = deque()
+        self._queued_messages = 0
+        self._condition = Condition()
+        self._send_started = None
+        self._retry_after = 0
+        self._running = True
+
+        self._thread = Thread(target=self._run,
+                              name='FixtureOutput[{0}]'.format(midi_patch_id),
+                              daemon=True)
+        self._thread.start()
+
+    def submit(self, messages, sources=None):
+        with self._condition:
+            if self.state is not OutputState.Healthy and self.policy.mode == 'drop' \
+                    and not self._retry_due():
+                self._metrics.record_dropped(self.midi_patch_id, len(messages))
+                return
+
+            self._queue.append((messages, sources))
+            self._queued_messages += len(messages)
+            self._enforce_limit()
+            self._metrics.set_queue_depth(self.midi_patch_id, self._queued_messages, 'output')
+            self._condition.notify()
+
+    def _retry_due(self):
+        return self.state is OutputState.Disconnected and monotonic() >= self._retry_after
+
+    def _enforce_limit(self):
+        while self._queued_messages > self.policy.buffer_limit and len(self._queue) > 1:
+            messages, _ = self._queue.popleft()
+            self._queued_messages -= len(messages)
+            self._metrics.record_dropped(self.midi_patch_id, len(messages))
+
+    def check_deadline(self, now):
+        '''Called by the watchdog: mark the output stalled if a send is overrunning.'''
+        started = self._send_started
+        if started is None or self.state is not OutputState.Healthy:
+            return
+        if now - started > self.policy.deadline:
+            self.state = OutputState.Stalled
+            logger.warning('MIDI output "%s" has stalled; %s messages sent to it.',
+                           self.midi_patch_id,
+                           'buffering' if self.policy.mode == 'buffer' else 'dropping')
+            self._notify('state_changed', self.state)
+
+    def _notify(self, event, *args):
+        callback = self._callbacks[event]
+        if callback is None:
+            return
+        try:
+            callback(self.midi_patch_id, *args)
+        except Exception: # pylint: disable=broad-except
+            logger.exception('Output "%s" callback failed', event)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._queue or self._waiting_to_retry()):
+                    timeout = self._retry_after - monotonic() if self._queue else None
+                    self._condition.wait(timeout)
+                # When stopping, send whatever's left - unless we can't.
+                if not self._running and (not self._queue or self.state is not OutputState.Healthy):
+                    return
+
+                messages, sources = self._queue[0]
+
+            if self._send_burst(messages, sources):
+                with self._condition:
+                    # Unless discarded on recovery, the burst we sent is still at the head.
+                    if self._queue and self._queue[0][0] is messages:
+                        self._queue.popleft()
+                        self._queued_messages -= len(messages)
+                    self._metrics.set_queue_depth(self.midi_patch_id, self._queued_messages, 'output')
+
+    def _waiting_to_retry(self):
+        return self.state is OutputState.Disconnected and monotonic() < self._retry_after
+
+    def _send_burst(self, messages, sources):
+        self._send_started = monotonic()
+        try:
+            for message in messages:
+                self._send(self.midi_patch_id, message)
+        except Exception: # pylint: disable=broad-except
+            self._send_started = None
+            self._metrics.record_error(self.midi_patch_id, sources)
+            with self._condition:
+                disconnected = self.state is not OutputState.Disconnected
+                if disconnected:
+                    logger.warning('Unable to send to MIDI output "%s"; will retry every %ss.',
+                                   self.midi_patch_id, self.policy.retry_interval,
+                                   exc_info=True)
+                self.state = OutputState.Disconnected
+                self._retry_after = monotonic() + self.policy.retry_interval
+                if self.policy.mode == 'drop':
+                    self._discard_queue()
+            if disconnected:
+                self._notify('state_changed', OutputState.Disconnected)
+            return False
+
+        self._send_started = None
+        self._metrics.record_sent(self.midi_patch_id, messages, sources)
+        self._notify('sent', messages, sources)
+
+        if self.state is not OutputState.Healthy:
+            with self._condition:
+                logger.info('MIDI output "%s" has recovered.', self.midi_patch_id)
+                previous, self.state = self.state, OutputState.Healthy
+                if self.policy.on_recovery == 'discard':
+                    self._discard_queue()
+            self._notify('state_changed', OutputState.Healthy, previous)
+        return True
+
+    def _discard_queue(self):
+        if self._queued_messages:
+            self._metrics.record_dropped(self.midi_patch_id, self._queued_messages)
+        self._queue.clear()
+        self._queued_messages = 0
+        self._metrics.set_queue_depth(self.midi_patch_id, 0, 'output')
+
+class OutputWatchdog:
+    '''Owns an OutputWorker per MIDI output, and polices their send deadlines.'''
+
+    def __init__(self, send, metrics, on_sent=None, on_state_changed=None):
+        '''`send` is called with `(midi_patch_id, message)` to actually send a message.
+
+        If given, `on_sent` is called with `(midi_patch_id, messages, sources)`
+        after each burst has been sent, and `on_state_changed` with
+        `(midi_patch_id, state)` - plus the previous state, on recovery - when
+        an output's state changes. Neither is called from the main thread.
+        '''
+        self._send = send
+        self._metrics = metrics
+        self._on_sent = on_sent
+        self._on_state_changed = on_state_changed
+        self._workers = {}
+        self._lock = Lock()
+        self.policy = OutputPolicy()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name='FixtureOutputWatchdog', daemon=True)
+        self._thread.start()
+
+    def configure(self, **kwargs):
+        self.policy = OutputPolicy(**kwargs)
+        with self._lock:
+            for worker in self._workers.values():
+                worker.policy = self.policy
+
+    def worker(self, midi_patch_id):
+        with self._lock:
+            if midi_patch_id not in self._workers:
+                self._workers[midi_patch_id] = OutputWorker(
+                    midi_patch_id, self._send, self._metrics, self.policy,
+                    self._on_sent, self._on_state_changed)
+            return self._workers[midi_patch_id]
+
+    def submit(self, midi_patch_id, messages, sources=None):
+        self.worker(midi_patch_id).submit(messages, sources)
+
+    def state(self, midi_patch_id):
+        with self._lock:
+            worker = self._workers.get(midi_patch_id)
+        return worker.state if worker is not None else OutputState.Healthy
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for worker in self._workers.values():
+                worker.stop()
+
+    def _run(self):
+        while not self._stopped.wait(min(0.1, self.policy.deadline / 4)):
+            now = monotonic()
+            with self._lock:
+                workers = list(self._workers.values())
+            for worker in workers:
+                worker.check_deadline(now)
@@ -0,0 +1,155 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+'''The format patches are saved in, within a session file.
+
+Version 1 patches hold only what identifies and addresses each fixture:
+
+    {'patch_id', 'fixture_id', 'midi_patch_id', ['midi_channel'], ['midi_deviceid']}
+
+Version 2 patches also hold the fixture's width (in MIDI channels) and its
+flags (see below), as resolved from the fixture library when the fixture was
+patched. A version 2 patch can thus be loaded and validated without looking
+anything up in the library.
+'''
+
+import logging
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+PATCH_SCHEMA_VERSION = 2
+
+# Fixture flags
+REQUIRES_CHANNEL = 0x1
+REQUIRES_DEVICEID = 0x2
+DCA_CAPABLE = 0x4
+
+CHANNEL_COUNT = 16
+DEVICEID_COUNT = 111
+
+def profile_flags(description):
+    '''Returns the flags of a fixture, given its description from the fixture library catalogue.'''
+    flags = 0
+    if description['requiresMidiChannel']:
+        flags |= REQUIRES_CHANNEL
+    if description['requiresMidiDeviceID']:
+        flags |= REQUIRES_DEVICEID
+    if description['dcaCapable']:
+        flags |= DCA_CAPABLE
+    return flags
+
+def flags_as_profile(width, flags):
+    '''Returns width and flags in the form of a fixture library catalogue description.'''
+    return {
+        'width': width,
+        'requiresMidiChannel': bool(flags & REQUIRES_CHANNEL),
+        'requiresMidiDeviceID': bool(flags & REQUIRES_DEVICEID),
+        'dcaCapable': bool(flags & DCA_CAPABLE),
+    }
+
+def schema_version(config):
+    return config.get('patch_schema', 1)
+
+def upgrade(config, describe):
+    '''Returns the patches of a session config, in the current schema.
+
+    Patches saved in an older schema have their width and flags resolved by
+    calling `describe` with their fixture id (which should return the
+    fixture's catalogue description), once per distinct fixture.
+    '''
+    if schema_version(config) >= PATCH_SCHEMA_VERSION:
+        return config['patches']
+
+    resolved = {}
+    patches = []
+    for patch in config['patches']:
+        fixture_id = patch['fixture_id']
+        if fixture_id not in resolved:
+            description = describe(fixture_id)
+            resolved[fixture_id] = (description['width'], profile_flags(description))
+        width, flags = resolved[fixture_id]
+        patches.append(dict(patch, width=width, flags=flags))
+    return patches
+
+class PatchConflict:
+    '''A patched fixture that can't be placed where it's been patched.'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, patch_id, midi_patch_id, reason):
+        self.patch_id = patch_id
+        self.midi_patch_id = midi_patch_id
+        self.reason = reason
+
+    def __str__(self):
+        return '{0} (on {1}): {2}'.format(self.patch_id, self.midi_patch_id, self.reason)
+
+def validate(patches):
+    '''Checks a list of (current schema) patches, in one pass.
+
+    Returns a tuple of:
+      - the channels (1-indexed) and device ids in use, as sets keyed by
+        MIDI output patch id;
+      - a list of `PatchConflict`s: fixtures out of range, or overlapping an
+        earlier fixture. Those in conflict aren't counted as using anything.
+    '''
+    channels = {}
+    deviceids = {}
+    conflicts = []
+    for patch in patches:
+        midi_patch_id = patch['midi_patch_id']
+        used_channels = channels.setdefault(midi_patch_id, set())
+        used_deviceids = deviceids.setdefault(midi_patch_id, set())
+
+        wanted_channels = ()
+        if patch['flags'] & REQUIRES_CHANNEL:
+            start = patch.get('midi_channel', -1) + 1
+            wanted_channels = range(start, start + patch['width'])
+            if start < 1 or wanted_channels[-1] > CHANNEL_COUNT:
+                conflicts.append(PatchConflict(patch['patch_id'], midi_patch_id,
+                                               'MIDI channel out of range'))
+                continue
+            if used_channels.intersection(wanted_channels):
+                conflicts.append(PatchConflict(patch['patch_id'], midi_patch_id,
+                                               'MIDI channel already in use'))
+                continue
+
+        deviceid = None
+        if patch['flags'] & REQUIRES_DEVICEID:
+            deviceid = patch.get('midi_deviceid', -1)
+            if not 1 <= deviceid <= DEVICEID_COUNT:
+                conflicts.append(PatchConflict(patch['patch_id'], midi_patch_id,
+                                               'MIDI device ID out of range'))
+                continue
+            if deviceid in used_deviceids:
+                conflicts.append(PatchConflict(patch['patch_id'], midi_patch_id,
+                                               'MIDI device ID already in use'))
+                continue
+
+        used_channels.update(wanted_channels)
+        if deviceid is not None:
+            used_deviceids.add(deviceid)
+
+    if conflicts:
+        logger.warning('Conflicts found in MIDI fixture patch:\n  %s',
+                       '\n  '.join(str(conflict) for conflict in conflicts))
+
+    return channels, deviceids, conflicts
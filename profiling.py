@@ -0,0 +1,120 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Opt-in, per-call profiling of the plugin's hot and cold paths.
+
+Functions decorated with `profiled` are run under cProfile when profiling has
+been enabled (see `configure`). Each call writes a binary profile (loadable
+with `pstats` or a viewer such as snakeviz) plus a plain-text summary to the
+report directory, of which only the most recent reports are kept. Reports
+are written from a background thread, so as not to hold up the profiled call.
+
+Only one call is profiled at a time, process-wide: cProfile can't nest, and
+(from Python 3.12) can't run in two threads at once either. Calls made while
+another is being profiled run unprofiled.
+
+When profiling is disabled, the cost of the decorator is one attribute check.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import cProfile
+from datetime import datetime
+from functools import wraps
+import io
+import logging
+import os
+import pstats
+import re
+import tempfile
+from threading import Lock
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'midi_fixture_control_profiles')
+REPORT_SUFFIXES = ('.prof', '.txt')
+# Reports are named `YYYYmmdd-HHMMSS-ffffff-<name>`; only files named so are rotated.
+REPORT_PATTERN = re.compile(r'^\d{8}-\d{6}-\d{6}-.+(\.prof|\.txt)$')
+SUMMARY_LENGTH = 40
+
+class _Settings:
+    # pylint: disable=too-few-public-methods
+    enabled = False
+    directory = DEFAULT_DIRECTORY
+    keep = 50
+
+_SETTINGS = _Settings()
+_PROFILE_LOCK = Lock()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ProfileWriter')
+
+def configure(enabled=False, directory='', keep=50):
+    '''Enable or disable profiling, and set where (and how many) reports are kept.'''
+    _SETTINGS.directory = directory or DEFAULT_DIRECTORY
+    _SETTINGS.keep = max(1, keep)
+    _SETTINGS.enabled = enabled
+    if enabled:
+        logger.info('Profiling enabled; reports will be written to %s', _SETTINGS.directory)
+
+def profiled(name):
+    '''Decorator: profile each call of the decorated function, when profiling is enabled.'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _SETTINGS.enabled or not _PROFILE_LOCK.acquire(blocking=False):
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                _PROFILE_LOCK.release()
+                _writer.submit(_write_report, name, profile, datetime.now(),
+                               _SETTINGS.directory, _SETTINGS.keep)
+        return wrapper
+    return decorator
+
+def _write_report(name, profile, finished, directory, keep):
+    basename = '{0}-{1}'.format(finished.strftime('%Y%m%d-%H%M%S-%f'), name)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profile.dump_stats(os.path.join(directory, basename + '.prof'))
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_LENGTH)
+        with open(os.path.join(directory, basename + '.txt'), 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
+
+        _rotate(directory, keep)
+    except OSError:
+        logger.exception('Unable to write profiling report to %s', directory)
+
+def _rotate(directory, keep):
+    reports = sorted({
+        os.path.splitext(filename)[0] for filename in os.listdir(directory)
+        if REPORT_PATTERN.match(filename)
+    })
+    for basename in reports[:-keep]:
+        for suffix in REPORT_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, basename + suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,147 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+from heapq import heappop, heappush
+from itertools import count
+import logging
+from threading import Condition, Thread
+from time import perf_counter, sleep
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+def now():
+    '''The scheduler's clock. Timestamps given to `SendScheduler.schedule` use this.'''
+    return perf_counter()
+
+class SchedulingStats:
+    '''Records how late (in seconds) scheduled sends were released.'''
+
+    def __init__(self):
+        self.count = 0
+        self.total_error = 0.0
+        self.max_error = 0.0
+        self.last_error = 0.0
+
+    def record(self, error):
+        self.count += 1
+        self.total_error += error
+        self.max_error = max(self.max_error, error)
+        self.last_error = error
+
+    @property
+    def mean_error(self):
+        return self.total_error / self.count if self.count else 0.0
+
+class SendScheduler:
+    '''Releases MIDI messages at requested times, from a dedicated thread.
+
+    The thread waits until shortly before the next send is due, as thread
+    wake-ups alone can be late by several milliseconds on a loaded machine.
+    For the remainder it yields repeatedly (releasing the GIL each time, so
+    the GUI and output threads aren't starved) until the send is due.
+    '''
+
+    # How long before a send is due to stop waiting and start yielding (seconds).
+    SpinThreshold = 0.002
+
+    # Scheduling errors beyond this (seconds) are logged.
+    WarnThreshold = 0.005
+
+    def __init__(self, send, queue_depth_changed=None):
+        '''`send` is called with `(midi_patch_id, messages, sources)` when a send is due.
+
+        If given, `queue_depth_changed` is called with `(midi_patch_id, depth)`
+        whenever the number of messages waiting for an output changes.
+        '''
+        self._send = send
+        self._queue_depth_changed = queue_depth_changed
+        self._queue_depths = {}
+        self._queue = []
+        self._sequence = count()
+        self._condition = Condition()
+        self._thread = None
+        self._running = False
+        self.stats = SchedulingStats()
+
+    def schedule(self, timestamp, midi_patch_id, messages, sources=None):
+        '''Send `messages` to `midi_patch_id` at `timestamp` (see `now()`).'''
+        with self._condition:
+            heappush(self._queue,
+                     (timestamp, next(self._sequence), midi_patch_id, messages, sources))
+            self._update_queue_depth(midi_patch_id, len(messages))
+            if self._thread is None:
+                self._running = True
+                self._thread = Thread(target=self._run, name='FixtureSendScheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self):
+        '''Stop the scheduler thread. Any pending sends are discarded.'''
+        with self._condition:
+            self._running = False
+            for midi_patch_id in list(self._queue_depths):
+                self._update_queue_depth(midi_patch_id, -self._queue_depths[midi_patch_id])
+            self._queue.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    if not self._queue:
+                        self._condition.wait()
+                        continue
+                    remaining = self._queue[0][0] - now()
+                    if remaining <= self.SpinThreshold:
+                        break
+                    self._condition.wait(remaining - self.SpinThreshold)
+
+                if not self._running:
+                    return
+
+                timestamp, _, midi_patch_id, messages, sources = heappop(self._queue)
+                self._update_queue_depth(midi_patch_id, -len(messages))
+
+            while now() < timestamp:
+                sleep(0)
+
+            self._release(timestamp, midi_patch_id, messages, sources)
+
+    def _update_queue_depth(self, midi_patch_id, change):
+        depth = self._queue_depths.get(midi_patch_id, 0) + change
+        self._queue_depths[midi_patch_id] = depth
+        if self._queue_depth_changed is not None:
+            self._queue_depth_changed(midi_patch_id, depth)
+
+    def _release(self, timestamp, midi_patch_id, messages, sources):
+        error = now() - timestamp
+        self.stats.record(error)
+        if error > self.WarnThreshold:
+            logger.debug('Scheduled send to %s released %.1f ms late', midi_patch_id, error * 1000)
+
+        try:
+            self._send(midi_patch_id, messages, sources)
+        except Exception: # pylint: disable=broad-except
+            logger.exception('Scheduled send to %s failed', midi_patch_id)
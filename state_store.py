@@ -0,0 +1,213 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import logging
+from threading import Lock, Thread
+from time import sleep
+
+from .output_coalescer import block_address
+
+logger = logging.getLogger(__name__) # pylint: disable=invalid-name
+
+# Bytes per second over a standard (31250 baud, 10 bits per byte) MIDI link.
+MIDI_LINK_RATE = 3125
+
+# The messages that set something on a fixture that then stays set, and so
+# may be replayed. Anything else (notes, which are as often triggers as not,
+# System Exclusive, etc.) is an action, and is never replayed.
+STATE_TYPES = frozenset(('control_change', 'polytouch'))
+
+# Key of a fixture's most recent recall (a block containing a Program Change,
+# plus any Control Changes, e.g. Bank Select, sent with it).
+RECALL = 'recall'
+
+class StateEntry:
+    '''The messages last sent to set one thing (or a set of things) on a fixture.'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, key, patch_id, messages):
+        self.key = key
+        self.patch_id = patch_id
+        self.messages = messages
+        # Whether these messages are known to have reached the output since
+        # it was last (re)connected.
+        self.delivered = False
+
+    @property
+    def size(self):
+        return sum(len(message.bytes()) for message in self.messages)
+
+class OutputStateStore:
+    '''Remembers what was last sent to each fixture, so it can be sent again.
+
+    For each fixture, the most recent block of messages for each parameter
+    (see `output_coalescer.block_address`, which tells NRPN and RPN
+    parameters apart by their parameter numbers) is kept, superseding earlier
+    values. Blocks that aren't parameter values (see `STATE_TYPES`) are
+    actions, and aren't kept.
+
+    A Program Change recalls a whole scene or snapshot, so only a fixture's
+    most recent recall is kept, and everything sent to the fixture before it
+    is forgotten: replaying that on top of the recall would undo it.
+
+    Entries are kept in the order they were last sent in, which is the order
+    they need to be replayed in: anything a command depended on (e.g. a DCA
+    assignment before a DCA level) was sent before it.
+
+    May be updated from any thread.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        # midi_patch_id -> OrderedDict(key -> StateEntry)
+        self._outputs = {}
+        self._resyncs = {}
+
+    @staticmethod
+    def _blocks(messages, sources):
+        if sources is None:
+            sources = [(None, len(messages))]
+        offset = 0
+        for patch_id, message_count in sources:
+            yield patch_id, messages[offset:offset + message_count]
+            offset += message_count
+
+    @staticmethod
+    def _key(patch_id, messages):
+        '''The parameter a block of messages sets, `RECALL`, or `None` if it's not to be kept.
+
+        Shares its address with the coalescer, so that what one keeps as
+        separate parameters the other does too.
+        '''
+        types = {message.type for message in messages}
+        if 'program_change' in types:
+            return (patch_id, RECALL) if types <= {'program_change', 'control_change'} else None
+        if not types <= STATE_TYPES:
+            return None
+        return block_address(patch_id, messages)
+
+    def record(self, midi_patch_id, messages, sources=None):
+        '''Record a burst of messages as the state last sent to an output.'''
+        with self._lock:
+            entries = self._outputs.setdefault(midi_patch_id, OrderedDict())
+            for patch_id, block in self._blocks(messages, sources):
+                if patch_id is None or not block:
+                    continue
+                key = self._key(patch_id, block)
+                if key is None:
+                    continue
+
+                if key[1] == RECALL:
+                    for old_key in [old_key for old_key, entry in entries.items()
+                                    if entry.patch_id == patch_id]:
+                        del entries[old_key]
+                entries.pop(key, None)
+                entries[key] = StateEntry(key, patch_id, block)
+
+    def mark_delivered(self, midi_patch_id, messages, sources=None):
+        '''Record that a burst of messages has actually reached an output.'''
+        with self._lock:
+            entries = self._outputs.get(midi_patch_id)
+            if not entries:
+                return
+            for patch_id, block in self._blocks(messages, sources):
+                if patch_id is None or not block:
+                    continue
+                key = self._key(patch_id, block)
+                entry = entries.get(key) if key is not None else None
+                if entry is not None and entry.messages == block:
+                    entry.delivered = True
+
+    def invalidate(self, midi_patch_id):
+        '''Forget that anything has reached an output (e.g. because it was disconnected).'''
+        with self._lock:
+            for entry in self._outputs.get(midi_patch_id, {}).values():
+                entry.delivered = False
+
+    def forget(self, patch_ids):
+        '''Forget the state of fixture patches (e.g. because they were unpatched or re-addressed).'''
+        patch_ids = set(patch_ids)
+        with self._lock:
+            for entries in self._outputs.values():
+                for key in [key for key, entry in entries.items() if entry.patch_id in patch_ids]:
+                    del entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._outputs = {}
+            self._resyncs = {}
+
+    def outputs(self):
+        with self._lock:
+            return list(self._outputs)
+
+    def pending(self, midi_patch_id):
+        '''Returns the entries of an output not known to have reached it, in replay order.'''
+        with self._lock:
+            return [entry for entry in self._outputs.get(midi_patch_id, {}).values()
+                    if not entry.delivered]
+
+    def resync(self, midi_patch_id, send, rate=MIDI_LINK_RATE, full=False):
+        '''Re-send the state of an output, on a background thread.
+
+        Only entries not known to have reached the output since it was last
+        (re)connected are sent, unless `full` is set. Sends are paced to
+        `rate` bytes per second. Any entry superseded part-way through is
+        skipped (its replacement having been sent anyway), and starting
+        another resync of the same output stops this one.
+
+        `send` is called with `(midi_patch_id, messages, sources)`.
+        '''
+        if full:
+            self.invalidate(midi_patch_id)
+
+        with self._lock:
+            token = object()
+            self._resyncs[midi_patch_id] = token
+
+        thread = Thread(target=self._resync, args=(midi_patch_id, send, rate, token),
+                        name='FixtureResync[{0}]'.format(midi_patch_id), daemon=True)
+        thread.start()
+        return thread
+
+    def _resync(self, midi_patch_id, send, rate, token):
+        entries = self.pending(midi_patch_id)
+        if entries:
+            logger.info('Resynchronising %s fixture state entries to MIDI output "%s".',
+                        len(entries), midi_patch_id)
+
+        for entry in entries:
+            with self._lock:
+                if self._resyncs.get(midi_patch_id) is not token:
+                    return
+                current = self._outputs.get(midi_patch_id, {}).get(entry.key)
+                if current is not entry or entry.delivered:
+                    continue
+                # Sent whilst holding the lock so a newer value can't be
+                # recorded (and sent) in between the check and the send.
+                send(midi_patch_id, entry.messages, [(entry.patch_id, len(entry.messages))])
+            sleep(entry.size / rate)
+
+        with self._lock:
+            if self._resyncs.get(midi_patch_id) is token:
+                del self._resyncs[midi_patch_id]
@@ -0,0 +1,165 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tempfile
+from threading import Lock
+from time import time
+
+def default_metrics_path(file_format):
+    '''Where metrics are written to, if no path has been configured.'''
+    return os.path.join(tempfile.gettempdir(),
+                        'midi_fixture_control.' + ('prom' if file_format == 'prometheus' else 'json'))
+
+class TrafficCounters:
+    '''Traffic and health counters of one MIDI output, or of one fixture.'''
+    # pylint: disable=too-few-public-methods
+
+    FIELDS = ('messages', 'bytes', 'errors', 'dropped', 'queue_depth', 'largest_burst')
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.largest_burst = 0
+        # Messages waiting, keyed by the queue they're waiting in.
+        self.queues = {}
+
+    @property
+    def queue_depth(self):
+        return sum(self.queues.values())
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+class TrafficMetrics:
+    '''Counts what is sent, per MIDI output patch and per fixture patch.
+
+    May be updated from any thread.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self.outputs = {}
+        self.fixtures = {}
+        self.started = time()
+
+    def _counters(self, collection, key):
+        if key not in collection:
+            collection[key] = TrafficCounters()
+        return collection[key]
+
+    def record_sent(self, midi_patch_id, messages, sources=None):
+        '''Record a burst of messages sent to an output.
+
+        `sources` is an optional list of `(patch_id, message_count)` entries,
+        attributing consecutive runs of `messages` to the fixtures they're for.
+        '''
+        sizes = [len(message.bytes()) for message in messages]
+        with self._lock:
+            output = self._counters(self.outputs, midi_patch_id)
+            output.messages += len(sizes)
+            output.bytes += sum(sizes)
+            output.largest_burst = max(output.largest_burst, len(sizes))
+
+            offset = 0
+            for patch_id, message_count in sources or ():
+                if patch_id is not None:
+                    fixture = self._counters(self.fixtures, patch_id)
+                    fixture.messages += message_count
+                    fixture.bytes += sum(sizes[offset:offset + message_count])
+                    fixture.largest_burst = max(fixture.largest_burst, message_count)
+                offset += message_count
+
+    def record_error(self, midi_patch_id, sources=None):
+        with self._lock:
+            self._counters(self.outputs, midi_patch_id).errors += 1
+            for patch_id, _ in sources or ():
+                if patch_id is not None:
+                    self._counters(self.fixtures, patch_id).errors += 1
+
+    def record_dropped(self, midi_patch_id, message_count):
+        with self._lock:
+            self._counters(self.outputs, midi_patch_id).dropped += message_count
+
+    def set_queue_depth(self, midi_patch_id, depth, queue='scheduled'):
+        with self._lock:
+            self._counters(self.outputs, midi_patch_id).queues[queue] = depth
+
+    def reset(self):
+        with self._lock:
+            self.outputs = {}
+            self.fixtures = {}
+            self.started = time()
+
+    def snapshot(self):
+        '''Returns a copy of all counters, as plain dicts.'''
+        with self._lock:
+            return {
+                'started': self.started,
+                'outputs': {key: counters.as_dict() for key, counters in self.outputs.items()},
+                'fixtures': {key: counters.as_dict() for key, counters in self.fixtures.items()},
+            }
+
+    def write(self, path, file_format='json'):
+        '''Write the counters to file, atomically (as required by Prometheus' textfile collector).'''
+        snapshot = self.snapshot()
+        if file_format == 'prometheus':
+            content = _as_prometheus(snapshot)
+        else:
+            content = json.dumps(snapshot, indent=2, sort_keys=True)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _as_prometheus(snapshot):
+    descriptions = {
+        'messages': ('counter', 'MIDI messages sent'),
+        'bytes': ('counter', 'MIDI bytes sent'),
+        'errors': ('counter', 'Failed sends'),
+        'dropped': ('counter', 'MIDI messages dropped whilst an output was unavailable'),
+        'queue_depth': ('gauge', 'Messages waiting to be sent'),
+        'largest_burst': ('gauge', 'Largest number of messages sent in one burst'),
+    }
+    lines = []
+    for scope, label in (('outputs', 'output'), ('fixtures', 'patch')):
+        for field in TrafficCounters.FIELDS:
+            if scope == 'fixtures' and field in ('dropped', 'queue_depth'):
+                continue
+            metric_type, description = descriptions[field]
+            name = 'lisp_midi_fixture_{0}_{1}{2}'.format(
+                label, field, '_total' if metric_type == 'counter' else '')
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} {1}'.format(name, metric_type))
+            for key, counters in sorted(snapshot[scope].items()):
+                lines.append('{0}{{{1}="{2}"}} {3}'.format(
+                    name, label, _escape_label(key), counters[field]))
+    return '\n'.join(lines) + '\n'
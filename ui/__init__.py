@@ -1,6 +1,7 @@
+from .command_picker import CommandIndex, CommandPicker, command_index, forget_command_indices
 from .fader import Fader
 from .label_delegate import LabelDelegate
 from .midi_patch_combo_delegate import MIDIPatchComboDelegate
-from .patch_selector import PatchSelector
+from .patch_selector import PatchListModel, PatchSelector
 from .radio_button_delegate import RadioButtonDelegate, RadioButtonHidableDelegate
 from .simple_table_view import SimpleTableView
@@ -0,0 +1,229 @@
+# This file is a derivation of work on - and as such shares the same
+# licence as - Linux Show Player
+#
+# Linux Show Player:
+#   Copyright 2012-2021 Francesco Ceruti <ceppofrancy@gmail.com>
+#
+# This file:
+#   Copyright 2021 s0600204
+#
+# Linux Show Player is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Linux Show Player is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Linux Show Player.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=missing-docstring, invalid-name
+
+import re
+
+# pylint: disable=no-name-in-module
+from PyQt5.QtCore import Qt, QModelIndex, QSortFilterProxyModel
+from PyQt5.QtGui import QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import QComboBox, QCompleter
+
+CategoryRole = Qt.UserRole + 1
+
+# Longest word prefix held in a CommandIndex's prefix table; longer search
+# terms fall back to a scan.
+MAX_PREFIX = 12
+
+def _words(text):
+    '''Splits text (including camelCase identifiers) into lowercase words.'''
+    return [word.lower() for word in re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+', text)]
+
+def _is_subsequence(needle, haystack):
+    remaining = iter(haystack)
+    return all(char in remaining for char in needle)
+
+class CommandIndex:
+    '''Searchable index of the commands of one fixture profile.
+
+    Commands are grouped by category: either as given by the fixture
+    definition, or else the first word of the command's id (so `dcaAssign`
+    and `dcaUnassign` are both under "Dca").
+
+    Build it once per fixture definition (see `command_index`); it, and the
+    item model it provides, can then be shared.
+    '''
+
+    def __init__(self, profile):
+        entries = []
+        for command in profile.command_list:
+            details = profile.command(command)
+            caption = details['caption'] if 'caption' in details else command
+            category = details.get('category') or (_words(command) or [''])[0].capitalize()
+            entries.append((command, caption, category))
+
+        # Group by category, keeping the profile's order within (and of) categories.
+        order = {}
+        for _, _, category in entries:
+            order.setdefault(category, len(order))
+        self.entries = sorted(entries, key=lambda entry: order[entry[2]])
+        self.categories = list(order)
+
+        self._prefixes = {}
+        self._haystacks = []
+        for idx, (command, caption, category) in enumerate(self.entries):
+            words = set(_words(caption) + _words(command) + _words(category))
+            for word in words:
+                for length in range(1, min(len(word), MAX_PREFIX) + 1):
+                    self._prefixes.setdefault(word[:length], set()).add(idx)
+            self._haystacks.append(' '.join([caption, command, category]).lower())
+
+        self._model = None
+        self._rows = None
+
+    def search(self, text):
+        '''Returns the entries matching some search text, as a dict of entry index to rank.
+
+        Lower ranks are better matches: 0 if every search term starts a word,
+        1 if every term appears somewhere, 2 if every term's letters appear in order.
+        '''
+        terms = text.lower().split()
+        if not terms:
+            return {idx: 0 for idx in range(len(self.entries))}
+
+        matches = None
+        for term in terms:
+            found = self._prefixes.get(term, set()) if len(term) <= MAX_PREFIX else set()
+            matches = found if matches is None else matches & found
+        ranks = {idx: 0 for idx in matches}
+
+        for idx, haystack in enumerate(self._haystacks):
+            if idx in ranks:
+                continue
+            if all(term in haystack for term in terms):
+                ranks[idx] = 1
+            elif all(_is_subsequence(term, haystack) for term in terms):
+                ranks[idx] = 2
+        return ranks
+
+    def model(self):
+        '''Returns an item model of the commands, with a separator between categories.'''
+        if self._model is None:
+            self._model = QStandardItemModel()
+            self._rows = []
+            previous = None
+            for command, caption, category in self.entries:
+                if previous is not None and category != previous:
+                    separator = QStandardItem()
+                    separator.setData('separator', Qt.AccessibleDescriptionRole)
+                    separator.setFlags(Qt.NoItemFlags)
+                    self._model.appendRow(separator)
+                item = QStandardItem(caption)
+                item.setData(command, Qt.UserRole)
+                item.setData(category, CategoryRole)
+                item.setToolTip(category)
+                self._rows.append(self._model.rowCount())
+                self._model.appendRow(item)
+                previous = category
+        return self._model
+
+    def row(self, idx):
+        '''Returns the row in `model()` of an entry.'''
+        self.model()
+        return self._rows[idx]
+
+_COMMAND_INDICES = {}
+
+def command_index(fixture_id, profile):
+    '''Returns the (cached) CommandIndex of a fixture definition.'''
+    if fixture_id not in _COMMAND_INDICES:
+        _COMMAND_INDICES[fixture_id] = CommandIndex(profile)
+    return _COMMAND_INDICES[fixture_id]
+
+def forget_command_indices(fixture_ids=None):
+    '''Drop cached CommandIndexes (of the given fixture definitions, or all of them).'''
+    if fixture_ids is None:
+        _COMMAND_INDICES.clear()
+        return
+    for fixture_id in fixture_ids:
+        _COMMAND_INDICES.pop(fixture_id, None)
+
+class CommandFilterProxyModel(QSortFilterProxyModel):
+    '''Shows the commands of a CommandIndex that match some search text, best first.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._command_index = None
+        self._ranks = {}
+
+    def setCommandIndex(self, command_index):
+        self._command_index = command_index
+        self.setSourceModel(command_index.model() if command_index else None)
+        self.setSearchText('')
+
+    def setSearchText(self, text):
+        self._ranks = {}
+        if self._command_index is not None:
+            for idx, rank in self._command_index.search(text).items():
+                self._ranks[self._command_index.row(idx)] = rank
+        self.invalidate()
+        self.sort(0)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        # pylint: disable=unused-argument
+        return source_row in self._ranks
+
+    def lessThan(self, left, right):
+        left_rank = self._ranks.get(left.row(), 3)
+        right_rank = self._ranks.get(right.row(), 3)
+        if left_rank != right_rank:
+            return left_rank < right_rank
+        return left.row() < right.row()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            return '{0}  ({1})'.format(super().data(index, Qt.EditRole),
+                                       super().data(index, CategoryRole))
+        return super().data(index, role)
+
+class CommandPicker(QComboBox):
+    '''A combobox of a fixture's commands, that may also be searched by typing into it.
+
+    Its model is shared with every other picker showing the same fixture
+    definition, so switching between fixtures rebuilds nothing.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.NoInsert)
+        self.lineEdit().setPlaceholderText('Search commands...')
+
+        self._filter = CommandFilterProxyModel(self)
+        self._completer = QCompleter(self._filter, self)
+        self._completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self._completer.setCompletionRole(Qt.EditRole)
+        self._completer.activated[QModelIndex].connect(self._completerActivated)
+        self.setCompleter(self._completer)
+
+        self.lineEdit().textEdited.connect(self._filter.setSearchText)
+        self.lineEdit().editingFinished.connect(self._restoreText)
+
+    def setCommandIndex(self, command_index):
+        '''Show the commands of a CommandIndex (or nothing, if `None`).'''
+        self._filter.setCommandIndex(command_index)
+        self.setModel(command_index.model() if command_index else QStandardItemModel(self))
+        # `setModel` also replaces the completer's model; restore ours.
+        self._completer.setModel(self._filter)
+        self.setCompleter(self._completer)
+
+    def _completerActivated(self, index):
+        source_index = self._filter.mapToSource(index)
+        if source_index.isValid():
+            self.setCurrentIndex(source_index.row())
+
+    def _restoreText(self):
+        # Searching shouldn't leave behind text that doesn't match the current command.
+        text = self.itemText(self.currentIndex())
+        if self.currentIndex() > -1 and self.lineEdit().text() != text:
+            self.lineEdit().setText(text)
@@ -25,21 +25,82 @@
 from math import log10, trunc
 
 # pylint: disable=no-name-in-module
-from PyQt5.QtCore import QPointF, QRect, Qt
+from PyQt5.QtCore import QEvent, QPointF, QRect, Qt
 from PyQt5.QtGui import (
     QColor,
     QFontDatabase,
     QFontMetrics,
     QPainter,
+    QPixmap,
 )
 from PyQt5.QtWidgets import QAbstractSlider, QStyle, QStyleOptionSlider
 
+class FaderLaw:
+    '''Lookup tables between dB and fader travel ("position").
+
+    dB values are handled as integer "steps" (`steps_per_db` steps per dB).
+    Positions follow the fader's logarithmic curve.
+
+    Tables are computed once per distinct range and resolution, and shared
+    between all Faders that use them: use `FaderLaw.get()` rather than
+    instantiating directly.
+    '''
+
+    curve = 128
+    _cache = {}
+
+    def __init__(self, db_min, db_max, steps_per_db, resolution):
+        self.steps_per_db = steps_per_db
+        self.resolution = resolution
+
+        self.step_min = round(db_min * steps_per_db)
+        self.step_max = round(db_max * steps_per_db)
+        self.position_min = self._calc_position(self.step_min)
+        self.position_max = self._calc_position(self.step_max)
+
+        # step -> position
+        self._positions = [
+            self._calc_position(step) for step in range(self.step_min, self.step_max + 1)
+        ]
+
+        # position -> step
+        self._steps = [
+            self._calc_step(position)
+            for position in range(self.position_min, self.position_max + 1)
+        ]
+
+    @classmethod
+    def get(cls, db_min, db_max, steps_per_db=1, resolution=1024):
+        '''Return the (shared) law for the given range and resolution.'''
+        key = (db_min, db_max, steps_per_db, resolution)
+        if key not in cls._cache:
+            cls._cache[key] = cls(*key)
+        return cls._cache[key]
+
+    def _calc_position(self, step):
+        return round((10 ** (step / self.steps_per_db / self.curve)) * self.resolution)
+
+    def _calc_step(self, position):
+        return round(self.steps_per_db * self.curve * log10(position / self.resolution))
+
+    def _clamp(self, value, lower, upper):
+        # pylint: disable=no-self-use
+        return max(lower, min(value, upper))
+
+    def position_from_step(self, step):
+        step = self._clamp(round(step), self.step_min, self.step_max)
+        return self._positions[step - self.step_min]
+
+    def step_from_position(self, position):
+        position = self._clamp(round(position), self.position_min, self.position_max)
+        return self._steps[position - self.position_min]
+
 class Fader(QAbstractSlider):
 
     textWidth = 52
-    sliderStyleOption = QStyleOptionSlider()
-    sliderCurve = 128
     sliderResol = 1024
+    fineStepsPerDb = 10
+    fineSliderResol = 32768
     ticks = [-60, -54, -48, -42, -36, -30, -24, -18, -12, -9, -6, -3, 0, 3, 6, 9, 10]
 
     def __init__(
@@ -47,12 +108,18 @@ class Fader(QAbstractSlider):
         parent=None,
         dBMin=-60,
         dBMax=+10,
+        fine=False,
         **kwargs
     ):
         super().__init__(parent, **kwargs)
 
         self.dBMin = dBMin
         self.dBMax = dBMax
+        self._fine = False
+        self._law = None
+
+        # Per-instance, as its geometry is baked into the cached background.
+        self.sliderStyleOption = QStyleOptionSlider()
 
         self._mouseDown = False
         self._sliderMargin = 0
@@ -61,8 +128,11 @@ class Fader(QAbstractSlider):
         self.borderColor = QColor(80, 80, 80)
         self.markings = []
 
-        self.setSingleStep(1)
-        self.setPageStep(3)
+        # The static parts of the widget (markings, their labels, and the
+        # slider's groove), rendered once and reused until the size or style
+        # of the widget changes.
+        self._background = None
+
         self.setOrientation(Qt.Horizontal)
         self.setFocusPolicy(Qt.WheelFocus)
 
@@ -70,6 +140,8 @@ class Fader(QAbstractSlider):
         font.setPointSize(font.pointSize() - 4)
         self._unit_font = font
 
+        self.setFineResolution(fine)
+
     def setupSlider(self):
         self.sliderStyleOption.initFrom(self)
         self.sliderStyleOption.rect = QRect(0, 0, self.width() - self.textWidth, 12)
@@ -98,11 +170,60 @@ class Fader(QAbstractSlider):
                 self._linear_rescale_point(self.dbToSliderValue(tick), left_coord, right_coord),
             ])
 
+    def setFineResolution(self, fine):
+        '''Switch between whole-dB steps and fine (tenth of a dB) steps.
+
+        In fine mode the slider's underlying integer `value()` is in tenths of
+        a dB; use `dbValue()` and `setDbValue()` to work in dB regardless of mode.
+        '''
+        db_value = self.dbValue() if self._law else None
+        db_range = (self.dbFromStep(self.minimum()), self.dbFromStep(self.maximum())) \
+            if self._law else None
+
+        self._fine = fine
+        self._law = FaderLaw.get(self.dBMin,
+                                 self.dBMax,
+                                 steps_per_db=self.fineStepsPerDb if fine else 1,
+                                 resolution=self.fineSliderResol if fine else self.sliderResol)
+
+        self.setSingleStep(self._law.steps_per_db)
+        self.setPageStep(3 * self._law.steps_per_db)
+
+        if db_range is None:
+            return
+
+        self.setDbRange(*db_range)
+        self.setDbValue(db_value)
+        self.setupSlider()
+        self.updateMarkings()
+        self._background = None
+        self.update()
+
+    def isFineResolution(self):
+        return self._fine
+
+    def dbToStep(self, dbValue):
+        return round(dbValue * self._law.steps_per_db)
+
+    def dbFromStep(self, step):
+        if self._fine:
+            return step / self._law.steps_per_db
+        return step
+
+    def dbValue(self):
+        return self.dbFromStep(self.value())
+
+    def setDbValue(self, dbValue):
+        self.setValue(self.dbToStep(dbValue))
+
+    def setDbRange(self, dbMin, dbMax):
+        self.setRange(self.dbToStep(dbMin), self.dbToStep(dbMax))
+
     def dbToSliderValue(self, dbValue):
-        return round((10 ** (dbValue / self.sliderCurve)) * self.sliderResol)
+        return self._law.position_from_step(self.dbToStep(dbValue))
 
     def dbFromSliderValue(self, sliderValue):
-        return round(self.sliderCurve * log10(sliderValue / self.sliderResol))
+        return self.dbFromStep(self._law.step_from_position(sliderValue))
 
     def _linear_rescale_point(self, point, coord_a, coord_b):
         '''Rescales a point on one range to where it would be on another.
@@ -119,10 +240,12 @@ class Fader(QAbstractSlider):
     def enterEvent(self, event):
         # pylint: disable=unused-argument
         self.sliderStyleOption.state |= QStyle.State_HasFocus
+        self.update()
 
     def leaveEvent(self, event):
         # pylint: disable=unused-argument
-        self.sliderStyleOption.state ^= QStyle.State_HasFocus
+        self.sliderStyleOption.state &= ~QStyle.State_HasFocus
+        self.update()
 
     def isOverSlider(self, event):
         # 0 : Not over slider
@@ -139,7 +262,7 @@ class Fader(QAbstractSlider):
         x1 = (self._sliderX[0], self.sliderStyleOption.minimum)
         x2 = (self._sliderX[1], self.sliderStyleOption.maximum)
         point = self._linear_rescale_point(xPos, x1, x2)
-        self.setValue(self.dbFromSliderValue(point))
+        self.setValue(self._law.step_from_position(point))
 
     def mouseMoveEvent(self, event):
         if self.isSliderDown():
@@ -163,15 +286,26 @@ class Fader(QAbstractSlider):
         # pylint: disable=unused-argument
         self.setupSlider()
         self.updateMarkings()
+        self._background = None
 
-    def paintEvent(self, event):
-        super().paintEvent(event)
+    def changeEvent(self, event):
+        if event.type() in (QEvent.PaletteChange, QEvent.StyleChange, QEvent.FontChange):
+            self._background = None
+            self.update()
+        super().changeEvent(event)
 
+    def renderBackground(self):
+        '''Render the parts of the widget that don't change with its value.'''
         height = self.height()
         width = self.width()
 
+        ratio = self.devicePixelRatioF()
+        background = QPixmap(round(width * ratio), round(height * ratio))
+        background.setDevicePixelRatio(ratio)
+        background.fill(Qt.transparent)
+
         painter = QPainter()
-        painter.begin(self)
+        painter.begin(background)
 
         # Draw markings underneath slider
         painter.setPen(self.borderColor)
@@ -181,16 +315,8 @@ class Fader(QAbstractSlider):
                 QPointF(mark[1], height)
             )
 
-        # Write current level
-        painter.setPen(self.palette().windowText().color())
-        painter.drawText(
-            width - self.textWidth, 0,
-            self.textWidth, height,
-            Qt.AlignCenter,
-            str(self.value()) + " dB"
-        )
-
         # Draw markings' texts (underneath the slider's handle)
+        painter.setPen(self.palette().windowText().color())
         text_height = QFontMetrics(self._unit_font).ascent()
         painter.setFont(self._unit_font)
         for mark in self.markings:
@@ -203,9 +329,45 @@ class Fader(QAbstractSlider):
                 str(mark[0]),
             )
 
-        # Draw slider
-        self.sliderStyleOption.sliderPosition = self.dbToSliderValue(self.value())
+        # Draw the slider's groove. Some styles (e.g. Fusion) fill the groove up
+        # to the handle, or highlight it on hover or focus; so that what's cached
+        # doesn't depend on either, it's drawn as if at minimum and at rest.
+        groove = QStyleOptionSlider(self.sliderStyleOption)
+        groove.palette = self.palette()
+        groove.subControls = QStyle.SC_SliderGroove
+        groove.activeSubControls = QStyle.SC_None
+        groove.sliderPosition = groove.minimum
+        groove.sliderValue = groove.minimum
+        groove.state &= ~(QStyle.State_HasFocus | QStyle.State_MouseOver | QStyle.State_Sunken)
+        self.style().drawComplexControl(QStyle.CC_Slider, groove, painter)
+
+        painter.end()
+        self._background = background
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+
+        if self._background is None:
+            self.renderBackground()
+
+        painter = QPainter()
+        painter.begin(self)
+        painter.drawPixmap(0, 0, self._background)
+
+        # Write current level
+        painter.setPen(self.palette().windowText().color())
+        painter.drawText(
+            self.width() - self.textWidth, 0,
+            self.textWidth, self.height(),
+            Qt.AlignCenter,
+            ('{:.1f} dB' if self._fine else '{} dB').format(self.dbValue())
+        )
+
+        # Draw slider's handle
+        self.sliderStyleOption.sliderPosition = self._law.position_from_step(self.value())
         self.sliderStyleOption.palette = self.palette()
+        self.sliderStyleOption.subControls = QStyle.SC_SliderHandle
         self.style().drawComplexControl(QStyle.CC_Slider, self.sliderStyleOption, painter)
+        self.sliderStyleOption.subControls = QStyle.SC_All
 
         painter.end()
@@ -1,51 +1,103 @@
 
-from PyQt5.QtGui import QStandardItem
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QStandardItem, QStandardItemModel
 from PyQt5.QtWidgets import QComboBox
 
 from lisp.plugins import get_plugin
 
 
-class PatchSelector(QComboBox):
+class PatchListModel(QStandardItemModel):
+    '''List of patched fixtures, grouped under a subheader per MIDI output.
+
+    A single instance of this is held by the plugin and shared by every
+    PatchSelector. It is updated in place (see `update`) when the session's
+    patch configuration changes, so that views of it keep their selections
+    and don't need to rebuild anything themselves.
+    '''
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._midi = get_plugin('Midi')
-        self._plugin = get_plugin('MidiFixtureControl')
-
-    def add_subheader(self, midi_patch_id):
-        new_item = QStandardItem(self._midi.output_name_formatted(midi_patch_id))
-        new_item.setEnabled(False)
-        font = new_item.font()
-        font.setBold(True)
-        new_item.setFont(font)
-        self.model().appendRow(new_item)
+        self._keys = []
 
-    def add_definition(self, definition):
-        patch_id = definition['patch_id']
-        profile = self._plugin.get_profile(patch_id)
+    @staticmethod
+    def _caption(profile):
         addresses = []
         if profile.channel is not None:
             addresses.append('Channel #' + str(profile.channel + 1))
         if profile.deviceid is not None:
             addresses.append('ID #' + str(profile.deviceid + 1))
-        caption = '{manufacturer} {model} [{addresses}]'.format_map(
+        return '{manufacturer} {model} [{addresses}]'.format_map(
             {
                 'manufacturer': profile.profile.manufacturer_name,
                 'model': profile.profile.name,
                 'addresses': ', '.join(addresses),
             })
-        self.addItem(caption, patch_id)
 
-    def refresh(self):
-        self.clear()
+    def _create_subheader(self, midi_patch_id):
+        new_item = QStandardItem(self._midi.output_name_formatted(midi_patch_id))
+        new_item.setEnabled(False)
+        font = new_item.font()
+        font.setBold(True)
+        new_item.setFont(font)
+        return new_item
+
+    @staticmethod
+    def _create_definition(patch_id, caption):
+        new_item = QStandardItem(caption)
+        new_item.setData(patch_id, Qt.UserRole)
+        return new_item
 
+    def update(self, patches, fixtures):
+        '''Bring the model in line with the given patch list.
+
+        Only the rows that differ are touched: rows no longer wanted are
+        removed, moved rows are relocated, new rows are inserted and captions
+        are only reset if they have actually changed.
+        '''
         midi_patches = {}
-        for definition in self._plugin.SessionConfig['patches']:
-            midi_patch_id = definition['midi_patch_id']
-            if midi_patch_id not in midi_patches:
-                midi_patches[midi_patch_id] = []
-            midi_patches[midi_patch_id].append(definition)
+        for definition in patches:
+            if definition['patch_id'] not in fixtures:
+                continue
+            midi_patches.setdefault(definition['midi_patch_id'], []).append(definition)
 
+        wanted = []
         for midi_patch_id, definitions in midi_patches.items():
-            self.add_subheader(midi_patch_id)
+            wanted.append((('output', midi_patch_id), None))
             for definition in definitions:
-                self.add_definition(definition)
+                patch_id = definition['patch_id']
+                wanted.append((('patch', patch_id), self._caption(fixtures[patch_id])))
+
+        wanted_keys = {key for key, _ in wanted}
+        for row in reversed(range(len(self._keys))):
+            if self._keys[row] not in wanted_keys:
+                self.removeRow(row)
+                del self._keys[row]
+
+        for row, (key, caption) in enumerate(wanted):
+            if row < len(self._keys) and self._keys[row] == key:
+                if caption is not None and self.item(row).text() != caption:
+                    self.item(row).setText(caption)
+                continue
+
+            if key in self._keys:
+                old_row = self._keys.index(key)
+                items = self.takeRow(old_row)
+                del self._keys[old_row]
+                if caption is not None:
+                    items[0].setText(caption)
+            elif key[0] == 'output':
+                items = [self._create_subheader(key[1])]
+            else:
+                items = [self._create_definition(key[1], caption)]
+
+            self.insertRow(row, items)
+            self._keys.insert(row, key)
+
+
+class PatchSelector(QComboBox):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._plugin = get_plugin('MidiFixtureControl')
+        self.setModel(self._plugin.patch_list_model)
+
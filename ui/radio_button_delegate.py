@@ -23,8 +23,8 @@
 from math import trunc
 
 # pylint: disable=no-name-in-module
-from PyQt5.QtCore import Qt, QEvent, QModelIndex
-from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtCore import Qt, QEvent, QModelIndex, QPoint, QRect
+from PyQt5.QtGui import QMouseEvent, QPainter, QPixmap
 from PyQt5.QtWidgets import QApplication, QRadioButton, QStyle, QStyledItemDelegate, QStyleOptionButton, QStyleOptionViewItem
 
 class RadioButtonDelegate(QStyledItemDelegate):
@@ -44,6 +44,11 @@ class RadioButtonDelegate(QStyledItemDelegate):
     # Without it, the radio button delegate appears unthemed.
     _radiobutton_stylehint = QRadioButton()
 
+    # Pre-rendered indicators, shared between all instances. Keyed on palette,
+    # pixel-ratio and checked-state; emptied when the application style changes.
+    _indicator_cache = {}
+    _indicator_cache_style = None
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.last_clicked_index = QModelIndex()
@@ -80,22 +85,50 @@ class RadioButtonDelegate(QStyledItemDelegate):
 
         return super().editorEvent(event, model, option, index)
 
+    @classmethod
+    def _indicator_pixmap(cls, option, checked):
+        '''Returns a (cached) pixmap of a radio-button indicator.'''
+        style = QApplication.style()
+        if style is not cls._indicator_cache_style:
+            cls._indicator_cache.clear()
+            cls._indicator_cache_style = style
+
+        ratio = cls._radiobutton_stylehint.devicePixelRatioF()
+        key = (cls._radiobutton_stylehint.palette().cacheKey(), ratio, checked)
+        if key in cls._indicator_cache:
+            return cls._indicator_cache[key]
+
+        size = style.subElementRect(QStyle.SE_RadioButtonIndicator, option).size()
+        pixmap = QPixmap(round(size.width() * ratio), round(size.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+
+        button_option = QStyleOptionButton()
+        cls._radiobutton_stylehint.initStyleOption(button_option)
+        button_option.state |= QStyle.State_On if checked else QStyle.State_Off
+        button_option.rect = QRect(QPoint(0, 0), size)
+
+        pixmap_painter = QPainter(pixmap)
+        style.drawControl(QStyle.CE_RadioButton,
+                          button_option,
+                          pixmap_painter,
+                          cls._radiobutton_stylehint)
+        pixmap_painter.end()
+
+        cls._indicator_cache[key] = pixmap
+        return pixmap
+
     def paint(self, painter, option, index):
         # pylint: disable=no-self-use
         '''Draw a radio-button circle in the middle of the draw-space'''
+        self._paint_indicator(painter, option, index.data(Qt.CheckStateRole) == Qt.Checked)
 
-        button_option = QStyleOptionButton()
-        self._radiobutton_stylehint.initStyleOption(button_option)
-        button_option.state |= QStyle.State_On if index.data(Qt.CheckStateRole) == Qt.Checked else QStyle.State_Off
-        button_option.rect = QApplication.style().subElementRect(QStyle.SE_RadioButtonIndicator,
-                                                                 option)
-        button_option.rect.moveTo(option.rect.center().x() - trunc(button_option.rect.width() / 2),
-                                  option.rect.center().y() - trunc(button_option.rect.height() / 2))
-
-        QApplication.style().drawControl(QStyle.CE_RadioButton,
-                                         button_option,
-                                         painter,
-                                         self._radiobutton_stylehint)
+    def _paint_indicator(self, painter, option, checked):
+        pixmap = self._indicator_pixmap(option, checked)
+        ratio = pixmap.devicePixelRatio()
+        painter.drawPixmap(option.rect.center().x() - trunc(pixmap.width() / ratio / 2),
+                           option.rect.center().y() - trunc(pixmap.height() / ratio / 2),
+                           pixmap)
 
 class RadioButtonHidableDelegate(RadioButtonDelegate):
     '''Hidable Radio Button Delegate
@@ -105,6 +138,7 @@ class RadioButtonHidableDelegate(RadioButtonDelegate):
     '''
     def paint(self, painter, option, index):
         # pylint: disable=no-self-use
-        if index.data(Qt.EditRole) == -1:
+        value = index.data(Qt.EditRole)
+        if value == -1:
             return
-        super().paint(painter, option, index)
+        self._paint_indicator(painter, option, bool(value))